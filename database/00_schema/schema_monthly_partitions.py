@@ -0,0 +1,30 @@
+####################### get packages #######################
+
+import pandas as pd
+from packages.db_utils import get_engine
+from packages.db_schema import partitioned_tables, convert_to_partitioned, ensure_monthly_partitions, archive_partitions
+
+# Create SQLAlchemy engine
+engine = get_engine()
+
+archive_before = None #e.g. "2019-01-01" to detach older months into the archive schema
+
+####################### 1. Convert monolithic fact tables into monthly partitions #######################
+
+for (schema, table), column in partitioned_tables.items():
+    print(f"Partitioning {schema}.{table}...")
+    if convert_to_partitioned(schema, table, column, engine=engine):
+        print(f"{schema}.{table} converted.")
+
+####################### 2. Create partitions ahead of ingestion #######################
+
+for (schema, table), column in partitioned_tables.items():
+    created = ensure_monthly_partitions(schema, table, pd.to_datetime("today"), engine=engine)
+    print(f"{created} new partitions for {schema}.{table}.")
+
+####################### 3. Archive old partitions #######################
+
+if archive_before is not None:
+    for (schema, table), column in partitioned_tables.items():
+        archived = archive_partitions(schema, table, archive_before, engine=engine)
+        print(f"Archived {len(archived)} partitions of {schema}.{table}.")
@@ -1,231 +1,81 @@
 ####################### get packages #######################
 
-import psycopg2
-from sqlalchemy import create_engine, DateTime, Float, String, Integer, Column
-from dotenv import load_dotenv
-import os
-import requests_cache
 import pandas as pd
-from retry_requests import retry
 from datetime import timedelta
+from functools import partial
+from packages.db_utils import get_engine, bulk_upsert, ensure_table, get_watermark, get_start_date
+from packages.api_utils import get_retry_session, stream_to_database
+from packages.open_meteo_utils import HISTORY_URL, timezone, weather_variables, batch_stations, fetch_weather_batch, empty_history_frame
+from packages.db_schema import ensure_monthly_partitions, apply_indexes
 
-# Load login data from .env file
-load_dotenv()
+# Create SQLAlchemy engine, PostgreSQL or DuckDB depending on the .env file
+engine = get_engine()
 
-DB_NAME = os.getenv('DB_NAME')
-DB_USERNAME = os.getenv('DB_USERNAME')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-
-DB_STRING = f'postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+####################### 1. Get list of coordinates of used weather stations from dim_weather_stations  #######################
 
-# Create SQLAlchemy engine
-engine = create_engine(DB_STRING)
+print("Retreiving list of weather stations...")
+# Load coordinates of used weather stations from database for fetching data from open-meteo api
+query_string1 = 'SELECT * FROM "02_silver"."dim_weather_stations"'
+weather_stations = pd.read_sql(query_string1, engine)
+station_id = weather_stations.station_id.to_list()
+stations_latitude = weather_stations.latitude.to_list()
+stations_longitude = weather_stations.longitude.to_list()
 
-# Create a new connection using psycopg2 for non-pandas operations
-conn = psycopg2.connect(
-    database=DB_NAME,
-    user=DB_USERNAME,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
+####################### 2. Fetch weather data from api for all used weather stations  #######################
 
-####################### 1. Get list of coordinates of used weather stations from dim_weather_stations  #######################
+concurrency = 10 #number of simultaneous requests to the api
 
-try:
-    cursor = conn.cursor()
-    cursor.execute("SELECT version();")
-    record = cursor.fetchone()
-    print("You are connected to -", record, "\n")
-    
-    print("Retreiving list of weather stations...")
-    # Load coordinates of used weather stations from database for fetching data from open-meteo api
-    query_string1 = 'SELECT * FROM "02_silver"."dim_weather_stations"'
-    weather_stations = pd.read_sql(query_string1, engine)    
-    station_id = weather_stations.station_id.to_list()    
-    stations_latitude = weather_stations.latitude.to_list()
-    stations_longitude = weather_stations.longitude.to_list()
-        
-except Exception as error:
-    print("Error while connecting to PostgreSQL:", error)
-    
-finally:
-    if conn:
-        cursor.close()
-        conn.close()
-        print("PostgreSQL connection is closed")
-        
-####################### 2. Fetch weather data from api for all used weather stations  #######################
+# Setup the Open-Meteo API client with cache and retry on error, shared by all concurrent requests
+retry_session = get_retry_session(pool_size=concurrency)
 
-# Setup the Open-Meteo API client with cache and retry on error
-cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-
-timezone = "Europe/Berlin"
-weather_variables = [
-            "temperature_2m",
-            "relative_humidity_2m",
-            "apparent_temperature",
-            "precipitation",
-            "cloud_cover",
-            "wind_speed_10m",
-            "wind_direction_10m",
-            "direct_radiation",
-            "diffuse_radiation",
-            "sunshine_duration"
-        ]
-
-start_date = (pd.to_datetime("today") - timedelta(days=7)).strftime("%Y-%m-%d") #lookback window of 7 days to limit load of retrieved data 
 end_date = (pd.to_datetime("today") - timedelta(days=2)).strftime("%Y-%m-%d") #cut-off date to avoid null values 
 
-# Function to fetch weather data for a specific station
-def fetch_weather_data(station_id, latitude, longitude):
-    url = "https://archive-api.open-meteo.com/v1/archive"
-    timezone = "Europe/Berlin"
+batch_size = 25 #number of stations requested in one api call
+queue_size = 4 #number of fetched batches waiting to be loaded into the database
+
+# Get latest loaded timestamp per station and start each station one day before its watermark, new stations use a 7 day lookback
+watermarks = get_watermark('01_bronze', 'raw_open_meteo_weather_history', group_by='station_id', engine=engine)
+start_dates = [get_start_date(watermarks.get(station), revision_days=1) for station in station_id]
+
+stations = pd.DataFrame({
+    'station_id': station_id,
+    'latitude': stations_latitude,
+    'longitude': stations_longitude,
+    'start_date': start_dates
+})
+stations = stations[stations.start_date <= end_date] #skip stations that are already up to date
+
+# Stations with the same window can share a request, so batch them per start date
+jobs = []
+for start_date, group in stations.groupby('start_date'):
     params = {
-        "latitude": latitude,
-        "longitude": longitude,
         "hourly": weather_variables,
         "timezone": timezone,
         "start_date": start_date,
-	    "end_date": end_date,
+        "end_date": end_date,
     }
-    response = retry_session.get(url, params=params)
-    response.raise_for_status()
-    data = response.json()
-    
-    hourly = data['hourly']
-    dates = pd.date_range(
-        start=pd.to_datetime(hourly['time'][0], utc=False),
-        periods=len(hourly['time']),
-        freq=pd.Timedelta(hours=1)
-    )
-    
-    dates = dates.tz_localize(timezone, ambiguous='NaT', nonexistent='shift_forward')
-    
-    hourly_data = pd.DataFrame({
-        'timestamp': dates,
-        'station_id': station_id,
-        'temperature_2m': hourly['temperature_2m'],
-        'relative_humidity_2m': hourly['relative_humidity_2m'],
-        'apparent_temperature': hourly['apparent_temperature'],
-        'precipitation': hourly['precipitation'],
-        'cloud_cover': hourly['cloud_cover'],
-        'wind_speed_10m': hourly['wind_speed_10m'],
-        'wind_direction_10m': hourly['wind_direction_10m'],
-        'direct_radiation': hourly['direct_radiation'],
-        'diffuse_radiation': hourly['diffuse_radiation'],
-        'sunshine_duration': hourly['sunshine_duration']               
-    })
-    
-    return hourly_data
-
-all_data = []
-
-print("Fetching data from API...")
-for i in range(len(station_id)):
-    station_data = fetch_weather_data(station_id[i], stations_latitude[i], stations_longitude[i])
-    all_data.append(station_data)
-
-# Combine all data into a single DataFrame
-new_weather_data = pd.concat(all_data, ignore_index=True)
-
-print("Inserting data into temporary table on database...")
-new_weather_data.to_sql('raw_open_meteo_weather_history_update_temp', engine, schema='01_bronze', if_exists='replace', index=False)
-
-        
-####################### 3. Execute statement to Insert temp table into raw table of historic data  #######################       
-
-# Load login data from .env file
-load_dotenv()
-
-DB_NAME = os.getenv('DB_NAME')
-DB_USERNAME = os.getenv('DB_USERNAME')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-
-DB_STRING = f'postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-
-# Create SQLAlchemy engine
-engine = create_engine(DB_STRING)
-
-# Create a new connection using psycopg2 for non-pandas operations
-conn = psycopg2.connect(
-    database=DB_NAME,
-    user=DB_USERNAME,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
-try:
-    cursor = conn.cursor()
-    cursor.execute("SELECT version();")
-    record = cursor.fetchone()
-    print("You are connected to -", record, "\n")
-    
-    # Insert new data into old history table
-    query_string1 = """    
-    INSERT INTO "01_bronze".raw_open_meteo_weather_history (
-        timestamp,
-        station_id,
-        temperature_2m,
-        relative_humidity_2m,
-        apparent_temperature,
-        precipitation,
-        cloud_cover,
-        wind_speed_10m,
-        wind_direction_10m,
-        direct_radiation,
-        diffuse_radiation,
-        sunshine_duration
-    )
-    SELECT
-        timestamp,
-        station_id,
-        temperature_2m,
-        relative_humidity_2m,
-        apparent_temperature,
-        precipitation,
-        cloud_cover,
-        wind_speed_10m,
-        wind_direction_10m,
-        direct_radiation,
-        diffuse_radiation,
-        sunshine_duration
-    FROM "01_bronze".raw_open_meteo_weather_history_update_temp
-    ON CONFLICT (timestamp, station_id) 
-    DO UPDATE SET 
-        temperature_2m = EXCLUDED.temperature_2m,
-        relative_humidity_2m = EXCLUDED.relative_humidity_2m,
-        apparent_temperature = EXCLUDED.apparent_temperature,
-        precipitation = EXCLUDED.precipitation,
-        cloud_cover = EXCLUDED.cloud_cover,
-        wind_speed_10m = EXCLUDED.wind_speed_10m,
-        wind_direction_10m = EXCLUDED.wind_direction_10m,
-        direct_radiation = EXCLUDED.direct_radiation,
-        diffuse_radiation = EXCLUDED.diffuse_radiation,
-        sunshine_duration = EXCLUDED.sunshine_duration;
-    """
-    #Statement to drop temporary table
-    query_string2 = """Drop table "01_bronze".raw_open_meteo_weather_history_update_temp;"""
-    
-    print("Insert new weather data with history of weather data...")
-    cursor.execute(query_string1)
-    
-    print("Droping temp table...")
-    cursor.execute(query_string2)
-    conn.commit()
-    
-    print("Update done!")
-    
-except Exception as error:
-    print("Error while connecting to PostgreSQL:", error)
-    
-finally:
-    if conn:
-        cursor.close()
-        conn.close()
-        print("PostgreSQL connection is closed")
\ No newline at end of file
+    for batch in batch_stations(group.station_id.to_list(), group.latitude.to_list(), group.longitude.to_list(), batch_size=batch_size):
+        jobs.append((params,) + batch)
+
+# Function to fetch weather data for a batch of stations
+fetch_weather_data = partial(fetch_weather_batch, retry_session, HISTORY_URL)
+
+# Function to load a fetched batch into the history table while the next batches are fetched
+def load_weather_data(df):
+    # Loaded and revised rows are marked, so the silver merge picks them up whatever hour they belong to
+    df['loaded_at'] = pd.Timestamp.now(tz=timezone)
+    return bulk_upsert(df, '01_bronze', 'raw_open_meteo_weather_history', ['timestamp', 'station_id'], engine)
+
+# Add the loaded_at column to history tables created before it was introduced
+ensure_table(empty_history_frame(), '01_bronze', 'raw_open_meteo_weather_history', ['timestamp', 'station_id'], engine)
+
+# Create monthly partitions for the fetched windows before loading
+if len(stations) > 0:
+    ensure_monthly_partitions('01_bronze', 'raw_open_meteo_weather_history', stations.start_date.min(), end_date, engine=engine)
+
+print("Fetching data from API and inserting it into history of weather data...")
+row_counts = stream_to_database(fetch_weather_data, jobs, load_weather_data, concurrency=concurrency, queue_size=queue_size)
+
+apply_indexes('01_bronze', 'raw_open_meteo_weather_history', engine)
+
+print(f"Update done! {sum(row_counts)} rows upserted.")
@@ -1,111 +1,107 @@
 ####################### get packages #######################
 
-import requests_cache
 import pandas as pd
-from retry_requests import retry
-from packages.db_utils import get_engine
-import time
-    
+from datetime import timedelta
+from packages.db_utils import get_engine, bulk_upsert, ensure_table, get_checkpoints, save_checkpoint
+from packages.api_utils import get_retry_session, fetch_concurrently, TokenBucket
+from packages.open_meteo_utils import HISTORY_URL, timezone, weather_variables, request_weight, fetch_weather_batch, empty_history_frame
+
+target_table = 'raw_open_meteo_weather_history_new'
+
+#create engine
+engine = get_engine()
+
+# Create target table with the key of the history table, so every window can be upserted as soon as it arrives
+ensure_table(empty_history_frame(), '01_bronze', target_table, ['timestamp', 'station_id'], engine)
+
+####################### 1. Select stations to backfill #######################
+
 # Load data from the database using SQLAlchemy engine
 query_string1 = 'SELECT * FROM "02_silver"."dim_active_weather_stations"'
-active_stations = pd.read_sql(query_string1, get_engine())
+active_stations = pd.read_sql(query_string1, engine)
 
-query_string2 = 'SELECT DISTINCT station_id FROM "01_bronze".raw_open_meteo_weather_history;'
-used_stations = pd.read_sql(query_string2, get_engine())
+# Unfinished stations that are not active anymore can not be resumed, new stations are sampled instead
+checkpoints = get_checkpoints(target_table, engine)
+unfinished = checkpoints[(checkpoints.status != 'done') & checkpoints.station_id.isin(active_stations.station_id)]
 
-used_ids = used_stations.station_id.unique()
+if len(unfinished) > 0:
+    # Resume interrupted backfill before sampling new stations
+    print("Resuming interrupted backfill...")
+    sampled_stations = active_stations[active_stations['station_id'].isin(unfinished.station_id)]
 
-# Removing rows where station_id is in the list
-stations_filtered = active_stations[~active_stations['station_id'].isin(used_ids)]     
+else:
+    query_string2 = 'SELECT DISTINCT station_id FROM "01_bronze".raw_open_meteo_weather_history;'
+    used_stations = pd.read_sql(query_string2, engine)
 
-# Function to sample up to the available number of station IDs in each state
-def sample_stations(group, n=2):
-    return group.sample(min(len(group), n))
+    used_ids = used_stations.station_id.unique()
 
-# Group by state and sample station_ids from each state
-sampled_stations = stations_filtered.groupby('state').apply(sample_stations).reset_index(drop=True)
-    
-station_id = sampled_stations.station_id.to_list()    
+    # Removing rows where station_id is in the list or was backfilled before
+    stations_filtered = active_stations[~active_stations['station_id'].isin(used_ids)]
+    stations_filtered = stations_filtered[~stations_filtered['station_id'].isin(checkpoints.station_id)]
+
+    # Function to sample up to the available number of station IDs in each state
+    def sample_stations(group, n=2):
+        return group.sample(min(len(group), n))
+
+    # Group by state and sample station_ids from each state
+    sampled_stations = stations_filtered.groupby('state').apply(sample_stations).reset_index(drop=True)
+
+station_id = sampled_stations.station_id.to_list()
 stations_latitude = sampled_stations.latitude.to_list()
 stations_longitude = sampled_stations.longitude.to_list()
 
 print(station_id, sep=",")
 
-####################### get weather forecast from api and push it into new table #######################
+####################### 2. Backfill stations window by window #######################
+
+concurrency = 4 #number of stations backfilled at the same time
+window_days = 365 #days of data per request
+
+backfill_start = pd.to_datetime("2018-10-01")
+backfill_end = pd.to_datetime("today").normalize() - timedelta(days=2) #cut-off date to avoid null values, newer data comes from the daily update
+
+# Open-Meteo free quota: 5.000 calls per hour sustained, 600 calls per minute as burst
+rate_limiter = TokenBucket(rate=5000 / 3600, capacity=600)
 
 # Setup the Open-Meteo API client with cache and retry on error
-cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-
-timezone = "Europe/Berlin"
-weather_variables = [
-            "temperature_2m",
-            "relative_humidity_2m",
-            "apparent_temperature",
-            "precipitation",
-            "cloud_cover",
-            "wind_speed_10m",
-            "wind_direction_10m",
-            "direct_radiation",
-            "diffuse_radiation",
-            "sunshine_duration"
-        ]
-
-# Function to fetch weather data for a specific station
-def fetch_weather_data(station_id, latitude, longitude):
-    url = "https://archive-api.open-meteo.com/v1/archive"
-    timezone = "Europe/Berlin"
-    params = {
-        "latitude": latitude,
-        "longitude": longitude,
-        "hourly": weather_variables,
-        "timezone": timezone,
-        "start_date": "2018-10-01",
-	    "end_date": "2024-07-10",
-    }
-    response = retry_session.get(url, params=params)
-    response.raise_for_status()
-    data = response.json()
-    
-    hourly = data['hourly']
-    dates = pd.date_range(
-        start=pd.to_datetime(hourly['time'][0], utc=False),
-        periods=len(hourly['time']),
-        freq=pd.Timedelta(hours=1)
-    )
-    
-    dates = dates.tz_localize(timezone, ambiguous='NaT', nonexistent='shift_forward')
-    
-    hourly_data = pd.DataFrame({
-        'timestamp': dates,
-        'station_id': station_id,
-        'temperature_2m': hourly['temperature_2m'],
-        'relative_humidity_2m': hourly['relative_humidity_2m'],
-        'apparent_temperature': hourly['apparent_temperature'],
-        'precipitation': hourly['precipitation'],
-        'cloud_cover': hourly['cloud_cover'],
-        'wind_speed_10m': hourly['wind_speed_10m'],
-        'wind_direction_10m': hourly['wind_direction_10m'],
-        'direct_radiation': hourly['direct_radiation'],
-        'diffuse_radiation': hourly['diffuse_radiation'],
-        'sunshine_duration': hourly['sunshine_duration']               
-    })
-    
-    return hourly_data
-
-all_data = []
+retry_session = get_retry_session(pool_size=concurrency)
 
-print("Fetching data from API...")
-for i in range(len(station_id)):
-    station_data = fetch_weather_data(station_id[i], stations_latitude[i], stations_longitude[i])
-    print(f"current import:{station_id[i]}")
-    time.sleep(60)
-    all_data.append(station_data)
+completed = checkpoints.set_index('station_id')['completed_until']
+
+# Function to backfill one station, every window is loaded and checkpointed before the next one is fetched
+def backfill_station(station_id, latitude, longitude):
+    last_day = completed.get(station_id)
+    window_start = backfill_start if last_day is None or pd.isna(last_day) else pd.to_datetime(last_day) + timedelta(days=1)
+    row_count = 0
+
+    # Register station before the first request, so a crash resumes it instead of sampling new stations
+    save_checkpoint(target_table, station_id, None if last_day is None or pd.isna(last_day) else str(last_day), 'running', engine)
+
+    while window_start <= backfill_end:
+        window_end = min(window_start + timedelta(days=window_days - 1), backfill_end)
+        params = {
+            "hourly": weather_variables,
+            "timezone": timezone,
+            "start_date": window_start.strftime("%Y-%m-%d"),
+            "end_date": window_end.strftime("%Y-%m-%d"),
+        }
 
-# Combine all data into a single DataFrame
-final_weather_data = pd.concat(all_data, ignore_index=True).sort_values(by='timestamp', ascending=False)
+        rate_limiter.acquire(request_weight((window_end - window_start).days + 1))
+        station_data = fetch_weather_batch(retry_session, HISTORY_URL, params, [station_id], [latitude], [longitude])
+        station_data.dropna(axis=0, inplace=True)
+        station_data['loaded_at'] = pd.Timestamp.now(tz=timezone)
 
-final_weather_data.dropna(axis=0, inplace=True)
+        row_count += bulk_upsert(station_data, '01_bronze', target_table, ['timestamp', 'station_id'], engine)
+        save_checkpoint(target_table, station_id, window_end.strftime("%Y-%m-%d"), 'running', engine)
+        print(f"current import:{station_id} until {window_end.date()}")
+
+        window_start = window_end + timedelta(days=1)
+
+    save_checkpoint(target_table, station_id, backfill_end.strftime("%Y-%m-%d"), 'done', engine)
+    return row_count
+
+print("Fetching data from API...")
+jobs = list(zip(station_id, stations_latitude, stations_longitude))
+row_counts = fetch_concurrently(backfill_station, jobs, concurrency=concurrency)
 
-print("Inserting data into database...")
-final_weather_data.to_sql('raw_open_meteo_weather_history_new', get_engine(), schema='01_bronze', if_exists='replace', index=False)
\ No newline at end of file
+print(f"Backfill done! {sum(row_counts)} rows inserted.")
@@ -1,56 +1,33 @@
-import requests
 import pandas as pd
-import psycopg2
-from sqlalchemy import create_engine, DateTime, Float, String, Integer, Column
-from dotenv import load_dotenv
-import os
-
-# Load login data from .env file
-load_dotenv()
-
-DB_NAME = os.getenv('DB_NAME')
-DB_USERNAME = os.getenv('DB_USERNAME')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-
-DB_STRING = f'postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+import threading
+from functools import partial
+from packages.db_utils import get_engine, bulk_upsert, ensure_table
+from packages.api_utils import get_retry_session, fetch_concurrently
+from packages.date_utils import monthly_windows
+from packages.energy_charts_utils import fetch_prices
 
 # Create SQLAlchemy engine
-engine = create_engine(DB_STRING)
-
-# Create a new connection using psycopg2 for non-pandas operations
-conn = psycopg2.connect(
-    database=DB_NAME,
-    user=DB_USERNAME,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
+engine = get_engine()
 
 bzn = "DE-LU"
 start = "2018-10-01"
-end = "2024-07-06"
-
-url = f"https://api.energy-charts.info/price?bzn={bzn}&start={start}&end={end}"
+end = pd.to_datetime("today").strftime("%Y-%m-%d")
 
-response = requests.get(url)
-json_data = response.json()
+concurrency = 6 #number of months fetched at the same time
+table = 'raw_energy_charts_day_ahead_prices_germany'
+table_lock = threading.Lock()
 
-# Extract relevant data
-unix_seconds = json_data['unix_seconds']
-prices = json_data['price']
-units = json_data['unit']
+# Setup the API client with retry on error, shared by all concurrent requests
+retry_session = get_retry_session(pool_size=concurrency)
 
-# Combine into a DataFrame
-df_prices = pd.DataFrame({
-    'timestamp': unix_seconds,
-     bzn : prices,
-    'unit': units
-})
+# Function to load one month into the database as soon as it is fetched
+def load_window(df_prices):
+    with table_lock:
+        ensure_table(df_prices, '01_bronze', table, ['timestamp'], engine)
+    return bulk_upsert(df_prices, '01_bronze', table, ['timestamp'], engine)
 
-# Convert timestamp to datetime and correct timezone
-df_prices['timestamp'] = pd.to_datetime(df_prices['timestamp'], unit='s')
-df_prices["timestamp"] = df_prices.timestamp.dt.tz_localize("UTC").dt.tz_convert("Europe/Berlin")
+print("Fetching price data by month...")
+windows = monthly_windows(start, end)
+row_counts = fetch_concurrently(partial(fetch_prices, retry_session, bzn=bzn), windows, concurrency=concurrency, on_result=load_window)
 
-df_prices.to_sql('raw_energy_charts_day_ahead_prices_germany', engine, schema='01_bronze', if_exists='replace', index=False)
\ No newline at end of file
+print(f"Backfill done! {sum(row_counts)} rows upserted from {len(windows)} months.")
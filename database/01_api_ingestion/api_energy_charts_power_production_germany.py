@@ -1,57 +1,37 @@
-import requests
 import pandas as pd
-import psycopg2
-from sqlalchemy import create_engine, DateTime, Float, String, Integer, Column
-from dotenv import load_dotenv
-import os
-
-# Load login data from .env file
-load_dotenv()
-
-DB_NAME = os.getenv('DB_NAME')
-DB_USERNAME = os.getenv('DB_USERNAME')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-
-DB_STRING = f'postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+import threading
+from functools import partial
+from packages.db_utils import get_engine, bulk_upsert, ensure_table
+from packages.api_utils import get_retry_session, fetch_concurrently
+from packages.date_utils import monthly_windows
+from packages.energy_charts_utils import fetch_total_power
+from packages.db_schema import ensure_monthly_partitions
 
 # Create SQLAlchemy engine
-engine = create_engine(DB_STRING)
-
-# Create a new connection using psycopg2 for non-pandas operations
-conn = psycopg2.connect(
-    database=DB_NAME,
-    user=DB_USERNAME,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
+engine = get_engine()
 
 country = "de"
 start = "2018-10-01"
-end = "2024-07-05"
-
-url = f"https://api.energy-charts.info/total_power?country={country}&start={start}&end={end}"
-
-response = requests.get(url)
-json_data = response.json()
+end = pd.to_datetime("today").strftime("%Y-%m-%d")
 
-# Extract the unix_seconds
-timestamps = json_data['unix_seconds']
+concurrency = 6 #number of months fetched at the same time
+table = 'raw_energy_charts_total_power_germany'
+table_lock = threading.Lock()
 
-# Create a dictionary to hold the data for the DataFrame
-data_dict = {'timestamp': pd.to_datetime(timestamps, unit='s')}
+# Setup the API client with retry on error, shared by all concurrent requests
+retry_session = get_retry_session(pool_size=concurrency)
 
-# Extract production type data and add to the dictionary
-for production_type in json_data['production_types']:
-    data_dict[production_type['name']] = production_type['data']
+# Function to load one month into the database as soon as it is fetched, new production types are added as columns
+def load_window(df_power):
+    with table_lock:
+        ensure_table(df_power, '01_bronze', table, ['timestamp'], engine)
+    return bulk_upsert(df_power, '01_bronze', table, ['timestamp'], engine)
 
-# Convert the dictionary to a DataFrame
-df_power = pd.DataFrame(data_dict)
+# Create monthly partitions for the whole range before loading, skipped if the table is not partitioned yet
+ensure_monthly_partitions('01_bronze', table, start, end, engine=engine)
 
-# Convert timestamp to datetime and correct timezone
-df_power['timestamp'] = pd.to_datetime(df_power['timestamp'], unit='s')
-df_power["timestamp"] = df_power.timestamp.dt.tz_localize("UTC").dt.tz_convert("Europe/Berlin")
+print("Fetching power data by month...")
+windows = monthly_windows(start, end)
+row_counts = fetch_concurrently(partial(fetch_total_power, retry_session, country=country), windows, concurrency=concurrency, on_result=load_window)
 
-df_power.to_sql('raw_energy_charts_total_power_germany', engine, schema='01_bronze', if_exists='replace', index=False)
\ No newline at end of file
+print(f"Backfill done! {sum(row_counts)} rows upserted from {len(windows)} months.")
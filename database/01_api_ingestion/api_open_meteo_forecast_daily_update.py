@@ -1,22 +1,106 @@
 ####################### get packages #######################
 
-import requests_cache
 import pandas as pd
-from retry_requests import retry
 from datetime import timedelta
+from functools import partial
 import numpy as np
-from packages.db_utils import get_engine
+from sqlalchemy import text
+from packages.db_utils import get_engine, bulk_upsert, is_duckdb, to_utc
+from packages.api_utils import get_retry_session, stream_to_database
+from packages.open_meteo_utils import FORECAST_URL, timezone, weather_variables, batch_stations, fetch_weather_batch
 
 
+####################### 0. Create append-only forecast store #######################
+
+weather_columns = ",\n    ".join(f"{variable} DOUBLE PRECISION" for variable in weather_variables)
+select_columns = ", ".join(["timestamp", "timestamp_fetched", "station_id"] + weather_variables + ["is_forecast"])
+
+# Every run adds a snapshot, the primary key starts with timestamp_fetched so finding the latest snapshot is an index lookup
+query_string0 = f"""
+CREATE TABLE IF NOT EXISTS "01_bronze".raw_open_meteo_weather_forecast_snapshots (
+    timestamp TIMESTAMPTZ NOT NULL,
+    timestamp_fetched TIMESTAMPTZ NOT NULL,
+    station_id BIGINT NOT NULL,
+    {weather_columns},
+    is_forecast TEXT,
+    PRIMARY KEY (timestamp_fetched, timestamp, station_id)
+);
+
+CREATE INDEX IF NOT EXISTS raw_open_meteo_weather_forecast_snapshots_station_idx
+ON "01_bronze".raw_open_meteo_weather_forecast_snapshots (station_id, timestamp, timestamp_fetched DESC);
+
+-- A snapshot is loaded in many batches, it is only read once its run marked it as completed
+CREATE TABLE IF NOT EXISTS "01_bronze".raw_open_meteo_weather_forecast_snapshots_completed (
+    timestamp_fetched TIMESTAMPTZ PRIMARY KEY,
+    completed_at TIMESTAMPTZ NOT NULL,
+    row_count BIGINT
+);
+"""
+
+# Snapshots loaded before the marker table existed count as completed, only done while the marker table is empty
+query_string_markers = """
+INSERT INTO "01_bronze".raw_open_meteo_weather_forecast_snapshots_completed (timestamp_fetched, completed_at, row_count)
+SELECT timestamp_fetched, now(), COUNT(*)
+FROM "01_bronze".raw_open_meteo_weather_forecast_snapshots
+WHERE NOT EXISTS (SELECT 1 FROM "01_bronze".raw_open_meteo_weather_forecast_snapshots_completed)
+GROUP BY timestamp_fetched;
+"""
+
+# PostgreSQL only, the as-of lookup is inlined by get_weather_forecast_as_of on DuckDB
+query_string_migration = f"""
+-- Move the snapshot of the former replaced table into the store once
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = '01_bronze' AND table_name = 'raw_open_meteo_weather_forecast' AND table_type = 'BASE TABLE'
+    ) THEN
+        INSERT INTO "01_bronze".raw_open_meteo_weather_forecast_snapshots ({select_columns})
+        SELECT {select_columns} FROM "01_bronze".raw_open_meteo_weather_forecast
+        WHERE timestamp IS NOT NULL
+        ON CONFLICT DO NOTHING;
+
+        DROP TABLE "01_bronze".raw_open_meteo_weather_forecast;
+    END IF;
+END $$;
+
+-- Latest completed snapshot as of a point in time
+CREATE OR REPLACE FUNCTION "01_bronze".weather_forecast_as_of(as_of TIMESTAMPTZ)
+RETURNS SETOF "01_bronze".raw_open_meteo_weather_forecast_snapshots
+LANGUAGE sql STABLE AS $$
+    SELECT * FROM "01_bronze".raw_open_meteo_weather_forecast_snapshots
+    WHERE timestamp_fetched = (
+        SELECT MAX(timestamp_fetched) FROM "01_bronze".raw_open_meteo_weather_forecast_snapshots_completed
+        WHERE timestamp_fetched <= as_of
+    )
+$$;
+"""
+
+query_string_view = f"""
+-- Latest completed snapshot, same content as the former replaced table
+CREATE OR REPLACE VIEW "01_bronze".raw_open_meteo_weather_forecast AS
+SELECT {select_columns}
+FROM "01_bronze".raw_open_meteo_weather_forecast_snapshots
+WHERE timestamp_fetched = (SELECT MAX(timestamp_fetched) FROM "01_bronze".raw_open_meteo_weather_forecast_snapshots_completed);
+"""
+
+engine = get_engine()
+with engine.begin() as conn:
+    conn.execute(text(query_string0))
+    if not is_duckdb(engine):
+        conn.execute(text(query_string_migration))
+    conn.execute(text(query_string_markers))
+    conn.execute(text(query_string_view))
+
 ####################### 1. Get list of coordinates of used weather stations from dim_weather_stations  #######################
 
 print("Retreiving list of weather stations...")
 # Load data from the database  
 query_string1 = 'SELECT * FROM "02_silver"."dim_active_weather_stations"' #for coordinates
-active_stations = pd.read_sql(query_string1, get_engine())
+active_stations = pd.read_sql(query_string1, engine)
 
 query_string2 = 'SELECT DISTINCT station_id FROM "01_bronze".raw_open_meteo_weather_history;' #for ids of station_ids used in data
-used_stations = pd.read_sql(query_string2, get_engine())
+used_stations = pd.read_sql(query_string2, engine)
 
 used_ids = used_stations.station_id.unique() #create list for filtering
 
@@ -27,82 +111,46 @@ station_id = weather_stations.station_id.to_list()
 stations_latitude = weather_stations.latitude.to_list()
 stations_longitude = weather_stations.longitude.to_list()
     
-####################### get weather forecast from api and push it into new table #######################
+####################### get weather forecast from api and append it to the forecast store #######################
+
+concurrency = 10 #number of simultaneous requests to the api
+batch_size = 25 #number of stations requested in one api call
+queue_size = 4 #number of fetched batches waiting to be loaded into the database
 
 # Setup the Open-Meteo API client with cache and retry on error
-cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-
-timezone = "Europe/Berlin"
-weather_variables = [
-            "temperature_2m",
-            "relative_humidity_2m",
-            "apparent_temperature",
-            "precipitation",
-            "cloud_cover",
-            "wind_speed_10m",
-            "wind_direction_10m",
-            "direct_radiation",
-            "diffuse_radiation",
-            "sunshine_duration"
-        ]
+retry_session = get_retry_session(pool_size=concurrency)
 
 timestamp_fetched = pd.to_datetime('today').tz_localize(timezone).floor('h')
 
-# Function to fetch weather data for a specific station
-def fetch_weather_data(station_id, latitude, longitude):
-    url = "https://api.open-meteo.com/v1/dwd-icon"
-    params = {
-        "latitude": latitude,
-        "longitude": longitude,
-        "hourly": weather_variables,
-        "timezone": timezone,
-        "past_days": 2
-    }
-    response = retry_session.get(url, params=params)
-    response.raise_for_status()
-    data = response.json()
-    
-    hourly = data['hourly']
-    dates = pd.date_range(
-        start=pd.to_datetime(hourly['time'][0], utc=False),
-        periods=len(hourly['time']),
-        freq=pd.Timedelta(hours=1)
-    )
-    
-    dates = dates.tz_localize(timezone, ambiguous='NaT', nonexistent='shift_forward')
-        
-    hourly_data = pd.DataFrame({
-        'timestamp': dates,
-        'timestamp_fetched': timestamp_fetched,
-        'station_id': station_id,
-        'temperature_2m': hourly['temperature_2m'],
-        'relative_humidity_2m': hourly['relative_humidity_2m'],
-        'apparent_temperature': hourly['apparent_temperature'],
-        'precipitation': hourly['precipitation'],
-        'cloud_cover': hourly['cloud_cover'],
-        'wind_speed_10m': hourly['wind_speed_10m'],
-        'wind_direction_10m': hourly['wind_direction_10m'],
-        'direct_radiation': hourly['direct_radiation'],
-        'diffuse_radiation': hourly['diffuse_radiation'],
-        'sunshine_duration': hourly['sunshine_duration']               
-    })
-    
-    return hourly_data
+params = {
+    "hourly": weather_variables,
+    "timezone": timezone,
+    "past_days": 2
+}
 
-all_data = []
+# Function to fetch weather data for a batch of stations
+fetch_weather_data = partial(fetch_weather_batch, retry_session, FORECAST_URL, params)
 
-print("Fetching data from API...")
-for i in range(len(station_id)):
-    station_data = fetch_weather_data(station_id[i], stations_latitude[i], stations_longitude[i])
-    all_data.append(station_data)    
-    
-# Combine all data into a single DataFrame
-forecast_weather_data = pd.concat(all_data, ignore_index=True).sort_values(by='timestamp', ascending=False)
+# Function to add a fetched batch as part of this run's snapshot
+def load_forecast_data(forecast_weather_data):
+    forecast_weather_data.insert(1, 'timestamp_fetched', timestamp_fetched)
+
+    #add difference between timestamp of observation and fetched time
+    forecast_weather_data["is_forecast"] = np.where(forecast_weather_data.timestamp > timestamp_fetched, "yes","no" )
+
+    return bulk_upsert(forecast_weather_data, '01_bronze', 'raw_open_meteo_weather_forecast_snapshots', ['timestamp_fetched', 'timestamp', 'station_id'], engine)
+
+print("Fetching data from API and inserting it into database...")
+jobs = batch_stations(station_id, stations_latitude, stations_longitude, batch_size=batch_size)
+row_counts = stream_to_database(fetch_weather_data, jobs, load_forecast_data, concurrency=concurrency, queue_size=queue_size)
 
-#add difference between timestamp of observation and fetched time
-forecast_weather_data["is_forecast"] = np.where(forecast_weather_data.timestamp > timestamp_fetched, "yes","no" )
+# Readers switch to the new snapshot only after its last batch is loaded, a crashed run is never read
+with engine.begin() as conn:
+    conn.execute(text("""
+        INSERT INTO "01_bronze".raw_open_meteo_weather_forecast_snapshots_completed (timestamp_fetched, completed_at, row_count)
+        VALUES (:timestamp_fetched, now(), :row_count)
+        ON CONFLICT (timestamp_fetched)
+        DO UPDATE SET completed_at = EXCLUDED.completed_at, row_count = EXCLUDED.row_count;
+    """), {"timestamp_fetched": to_utc(timestamp_fetched), "row_count": sum(row_counts)})
 
-# inserting data into database
-print("Inserting data into database...")  
-forecast_weather_data.to_sql('raw_open_meteo_weather_forecast', get_engine(), schema='01_bronze', if_exists='replace', index=False)    
\ No newline at end of file
+print(f"Snapshot {timestamp_fetched} done! {sum(row_counts)} rows inserted.")
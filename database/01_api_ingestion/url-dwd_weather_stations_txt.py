@@ -1,31 +1,9 @@
-import psycopg2
-from sqlalchemy import create_engine, DateTime, Float, String, Integer
-from dotenv import load_dotenv
-import os
+from sqlalchemy import inspect, text
+from packages.db_utils import get_engine
 import pandas as pd
 
-# Load login data from .env file
-load_dotenv()
-
-DB_NAME = os.getenv('DB_NAME')
-DB_USERNAME = os.getenv('DB_USERNAME')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-
-DB_STRING = f'postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-
 # Create SQLAlchemy engine
-engine = create_engine(DB_STRING)
-
-# Create a new connection using psycopg2 for non-pandas operations
-conn = psycopg2.connect(
-    database=DB_NAME,
-    user=DB_USERNAME,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
+engine = get_engine()
 
 url = "https://www.dwd.de/DE/leistungen/klimadatendeutschland/statliste/statlex_html.html;jsessionid=59BB3C5A492B7E29D3CFDF5723D5A5A3.live31092?view=nasPublication&nn=16102"
 file = pd.read_html(url)
@@ -67,21 +45,6 @@ df = df[order].sort_values(by="Stations_ID", ascending=True)
 df['Beginn'] = pd.to_datetime(df['Beginn'], format='%d.%m.%Y', errors='coerce')
 df['Ende'] = pd.to_datetime(df['Ende'], format='%d.%m.%Y', errors='coerce')
 
-# Define data types
-datatypes = {
-    columns[0]: Integer, 
-    columns[1]: String, 
-    columns[2]: String,
-    columns[3]: String,
-    columns[4]: Float,
-    columns[5]: Float,
-    columns[6]: Integer,
-    columns[7]: String,
-    columns[8]: String,
-    columns[9]: DateTime,
-    columns[10]: DateTime
-    }
-
 # Ensure the DataFrame does not have a MultiIndex
 if isinstance(df.columns, pd.MultiIndex):
     df.columns = ['_'.join(col).strip() for col in df.columns.values]
@@ -91,8 +54,57 @@ if isinstance(df.index, pd.MultiIndex):
     
 df.sort_values(by="Stations_ID", ascending=True).reset_index()
 
-# Write the DataFrame to the database
-df.to_sql('raw_dwd_weather_stations_full', engine, schema='01_bronze', if_exists='replace', index=False)
+####################### Diff against the stored catalogue #######################
+
+# A station has one row per kind of station (Kennung) and period of operation
+key_columns = ["Stations_ID", "Kennung", "Beginn"]
+value_columns = [column for column in order if column not in key_columns]
+df = df.drop_duplicates(subset=key_columns, keep="last")
+
+changed_at = pd.Timestamp.now(tz="Europe/Berlin")
+
+if not inspect(engine).has_table('raw_dwd_weather_stations_full', schema='01_bronze'):
+    stored = df.iloc[0:0]
+else:
+    stored = pd.read_sql('SELECT * FROM "01_bronze"."raw_dwd_weather_stations_full"', engine)
+    stored = stored.drop_duplicates(subset=key_columns, keep="last")
+
+merged = df.merge(stored, on=key_columns, how="outer", suffixes=("", "_stored"), indicator=True)
+
+# Compare every value column, two missing values count as equal
+differs = pd.Series(False, index=merged.index)
+for column in value_columns:
+    new, old = merged[column], merged[f"{column}_stored"]
+    differs |= (new != old) & ~(new.isna() & old.isna())
+
+# inserts are new rows, updates changed rows and closures rows that are not listed anymore
+merged["change_type"] = None
+merged.loc[merged["_merge"] == "left_only", "change_type"] = "insert"
+merged.loc[(merged["_merge"] == "both") & differs, "change_type"] = "update"
+merged.loc[merged["_merge"] == "right_only", "change_type"] = "closure"
+
+changes = merged[merged["change_type"].notna()]
+print(f"Station catalogue: {changes.change_type.value_counts().to_dict()} changes.")
+
+####################### Apply the changes #######################
+
+if len(changes) > 0:
+    removed_keys = changes.loc[changes["change_type"] != "insert", key_columns]
+    removed_keys = removed_keys.astype(object).where(removed_keys.notna(), None) # NaT to NULL
+    new_rows = changes.loc[changes["change_type"] != "closure", order]
+
+    change_set = changes[key_columns + ["change_type"]].copy()
+    change_set["changed_at"] = changed_at
+
+    # Catalogue and change set are written in one transaction, downstream builders never see half of a refresh
+    with engine.begin() as conn:
+        if len(removed_keys) > 0:
+            conn.execute(text("""
+                DELETE FROM "01_bronze"."raw_dwd_weather_stations_full"
+                WHERE "Stations_ID" = :Stations_ID
+                AND "Kennung" IS NOT DISTINCT FROM :Kennung
+                AND "Beginn" IS NOT DISTINCT FROM :Beginn
+            """), removed_keys.to_dict("records"))
 
-# Close the connection
-conn.close()
\ No newline at end of file
+        new_rows.to_sql('raw_dwd_weather_stations_full', conn, schema='01_bronze', if_exists='append', index=False)
+        change_set.to_sql('raw_dwd_weather_stations_changes', conn, schema='01_bronze', if_exists='append', index=False)
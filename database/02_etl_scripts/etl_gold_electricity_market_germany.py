@@ -1,25 +1,20 @@
+import os
+import sys
 import pandas as pd
-from packages.db_utils import get_engine
-
-print("loading power data...")
-query_string1 = 'select * from "02_silver".fact_total_power_germany'
-df_power = pd.read_sql(query_string1, get_engine())
-
-print("loading price data...")
-query_string2 = 'select * from "02_silver".fact_day_ahead_prices_germany'
-df_prices = pd.read_sql(query_string2, get_engine())
-
-print("loading weather data...")
-query_string3 = 'select * from "02_silver".fact_full_weather'
-df_weather = pd.read_sql(query_string3, get_engine())
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import text
+from packages.db_utils import get_engine, swap_load, is_duckdb, to_utc
+from packages.date_utils import monthly_windows
+from packages.db_schema import apply_indexes
 
+#create engine
+engine = get_engine()
 
 ############################ 1. Preperation of tables ############################
 
 ############################ Total Power Table
 
-print("Transforming power data...")
-#define aggregation method for aggregating to full hour 
+#define aggregation method for aggregating to full hour
 power_aggregation ={
     'hydro_pumped_storage_consumption': 'sum',
     'cross_border_electricity_trading': 'sum',
@@ -47,19 +42,10 @@ power_aggregation ={
     'fossil_production': 'sum'
 }
 
-#aggregating to full hour
-df_power = df_power.groupby(df_power.timestamp.dt.floor('H')).agg(power_aggregation).reset_index()
-
-############################ Prices Table
-
-print("Transforming price data...")
-df_prices.drop('unit', axis=1, inplace=True)
-df_prices.rename(columns={'de_lu': 'price_eur_mwh'}, inplace=True)
 
 ############################ Weather Table
 
-print("Transforming weather data...")
-#Define aggregation
+#Define aggregation over all stations
 weather_aggregation = {
     'temperature_2m': 'mean',
     'relative_humidity_2m': 'mean',
@@ -73,25 +59,6 @@ weather_aggregation = {
     'sunshine_duration': 'mean'
 }
 
-#drop columns
-df_weather.drop(['station_id','source_table', 'is_forecast'], axis=1, inplace=True)
-
-#aggregate
-df_weather = df_weather.groupby(['timestamp']).agg(weather_aggregation).reset_index().sort_values(by='timestamp', ascending=True)
-
-
-############################ 2. Merge of tables ############################
-
-print("Merging tables...")
-# Merge df_weather and df_power on 'timestamp'
-combined_df = pd.merge(df_weather, df_power, on='timestamp')
-
-# Merge the resulting DataFrame with df_prices on 'timestamp'
-combined_df = pd.merge(combined_df, df_prices, on='timestamp')
-
-#correct timezone
-combined_df['timestamp'] = combined_df['timestamp'].dt.tz_convert('Europe/Berlin')
-
 # Define the desired order of columns
 new_column_order = [
     'timestamp',
@@ -134,15 +101,137 @@ new_column_order = [
     'price_eur_mwh'    
 ]
 
-#new column order
-combined_df = combined_df[new_column_order]
-
-#Sort by timestamp
-combined_df.sort_values(by='timestamp', ascending=False, ignore_index=True, inplace=True)
-
-#dropping first row due to incomplete data when grouping quarter hours to full hours
-combined_df = combined_df.drop(combined_df.index[0])
-    
-############################ 3. Load to database ############################
-print("Loading new table...")
-combined_df.to_sql('fact_electricity_market_germany', get_engine(), schema='03_gold', if_exists='replace', index=False)
\ No newline at end of file
+#SQL names of the aggregation methods
+sql_functions = {'sum': 'SUM', 'mean': 'AVG'}
+
+
+def build_gold_query(where="TRUE"):
+    """
+    Generates the query that aggregates power and weather to full hours and joins them with the prices,
+    so the aggregation runs in the database instead of pulling every quarter hour and station.
+
+    Parameters:
+    where (str): Optional condition on the timestamp of every source table, e.g. "timestamp >= :start".
+
+    Returns:
+    str: Query string with one row per hour.
+    """
+    power_columns = ",\n        ".join(f"{sql_functions[method]}({column}) AS {column}" for column, method in power_aggregation.items())
+    weather_columns = ",\n        ".join(f"{sql_functions[method]}({column}) AS {column}" for column, method in weather_aggregation.items())
+
+    return f"""
+    WITH power AS (
+        SELECT
+        date_trunc('hour', timestamp) AS timestamp,
+        {power_columns}
+        FROM "02_silver".fact_total_power_germany
+        WHERE {where}
+        GROUP BY 1
+    ),
+    weather AS (
+        SELECT
+        timestamp,
+        {weather_columns}
+        FROM "02_silver".fact_full_weather
+        WHERE {where}
+        GROUP BY 1
+    ),
+    prices AS (
+        SELECT timestamp, date, time, de_lu AS price_eur_mwh
+        FROM "02_silver".fact_day_ahead_prices_germany
+        WHERE {where}
+    )
+    SELECT {", ".join(new_column_order)}
+    FROM weather
+    JOIN power USING (timestamp)
+    JOIN prices USING (timestamp)
+    ORDER BY timestamp DESC
+    """
+
+
+rebuild_table = 'fact_electricity_market_germany_rebuild'
+
+
+def rebuild_month(window):
+    """
+    Aggregates one month into the rebuild table, the rows never leave the database.
+
+    Parameters:
+    window (tuple): (start, end) of the month formatted as YYYY-MM-DD, end is exclusive.
+
+    Returns:
+    int: Number of inserted rows.
+    """
+    start, end = window
+    params = {
+        "start": to_utc(start),
+        "end": to_utc(end)
+    }
+
+    # Every process needs its own connections
+    worker_engine = get_engine()
+    with worker_engine.begin() as conn:
+        conn.execute(text(f'INSERT INTO "03_gold".{rebuild_table} {build_gold_query("timestamp >= :start AND timestamp < :end")}'), params)
+        # DuckDB reports no rowcount for INSERT ... SELECT, so the rows of the month are counted
+        row_count = conn.execute(text(f'SELECT COUNT(*) FROM "03_gold".{rebuild_table} WHERE timestamp >= :start AND timestamp < :end'), params).scalar()
+    worker_engine.dispose()
+
+    print(f"Rebuilt {start} to {end}: {row_count} rows")
+    return row_count
+
+
+def rebuild(workers):
+    """
+    Rebuilds the gold table month by month in parallel processes and replaces the old table at once.
+
+    Parameters:
+    workers (int): Number of months aggregated at the same time.
+    """
+    with engine.begin() as conn:
+        first_day, last_day = conn.execute(text('SELECT MIN(timestamp)::date, MAX(timestamp)::date + 1 FROM "02_silver".fact_day_ahead_prices_germany')).one()
+        conn.execute(text(f'DROP TABLE IF EXISTS "03_gold".{rebuild_table};'))
+        conn.execute(text(f'CREATE TABLE "03_gold".{rebuild_table} AS {build_gold_query("FALSE")};'))
+
+    windows = monthly_windows(str(first_day), str(last_day))
+    if is_duckdb(engine):
+        # An embedded DuckDB file has a single writing process, DuckDB parallelizes each month itself
+        row_counts = [rebuild_month(window) for window in windows]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            row_counts = list(executor.map(rebuild_month, windows))
+
+    with engine.begin() as conn:
+        #dropping latest hour due to incomplete data when grouping quarter hours to full hours
+        conn.execute(text(f'DELETE FROM "03_gold".{rebuild_table} WHERE timestamp = (SELECT MAX(timestamp) FROM "03_gold".{rebuild_table});'))
+
+        # Readers see either the old or the new table
+        conn.execute(text('DROP TABLE IF EXISTS "03_gold".fact_electricity_market_germany;'))
+        conn.execute(text(f'ALTER TABLE "03_gold".{rebuild_table} RENAME TO fact_electricity_market_germany;'))
+
+    apply_indexes('03_gold', 'fact_electricity_market_germany', engine)
+
+    print(f"Rebuild done! {sum(row_counts)} rows in {len(windows)} months.")
+
+
+if __name__ == '__main__':
+
+    ############################ 2. Full rebuild in monthly chunks ############################
+
+    if "--rebuild" in sys.argv:
+        rebuild(workers=min(4, os.cpu_count() or 1))
+        sys.exit()
+
+    ############################ 3. Aggregation and merge of tables in the database ############################
+
+    print("Aggregating and merging tables in the database...")
+    combined_df = pd.read_sql(build_gold_query(), engine)
+
+    #correct timezone
+    combined_df['timestamp'] = combined_df['timestamp'].dt.tz_convert('Europe/Berlin')
+
+    #dropping first row due to incomplete data when grouping quarter hours to full hours
+    combined_df = combined_df.drop(combined_df.index[0])
+
+    ############################ 4. Load to database ############################
+    print("Loading new table...")
+    swap_load(combined_df, '03_gold', 'fact_electricity_market_germany', engine=engine)
\ No newline at end of file
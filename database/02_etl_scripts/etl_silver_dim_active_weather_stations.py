@@ -1,60 +1,108 @@
 import pandas as pd
-from packages.db_utils import get_engine
+from sqlalchemy import inspect, text
+from packages.db_utils import get_engine, get_stored_watermark, set_stored_watermark, swap_load, to_utc
+from packages.db_schema import apply_indexes
 
 #create engine
 engine = get_engine()
 
-#get data
-query_string1 = 'SELECT * FROM "01_bronze"."raw_dwd_weather_stations_full"'
-df_weather_stations = pd.read_sql(query_string1, engine)
-
-#set dates to select active weather stations
-active_date = "2024-07-10 00:00:00.000" #should be automated to today - 2 days
-min_date = "2018-10-01 00:00:00.000"
-
-#make selection of data depending on active weather stations
-df_weather_stations.query('Ende >= @active_date and Beginn <= @min_date',inplace=True)
-df_weather_stations = df_weather_stations[["Stations_ID", "Stationsname","Breite", "Länge", "Bundesland","Beginn" ,"Ende"]]
-
-#Group entries by max date
-df_weather_stations = df_weather_stations.groupby("Stations_ID").max().reset_index()
-
-# Renaming the columns
-df_weather_stations.rename(columns={
-    'Stations_ID': 'station_id',
-    'Stationsname': 'station_name',
-    'Breite': 'latitude',
-    'Länge': 'longitude',
-    'Bundesland': 'state',
-    'Beginn': 'begin',
-    'Ende': 'end'
-}, inplace=True)
-
-# Mapping of states to regions
-state_to_region = {
-    'SH': 'north',
-    'HB': 'north',
-    'NI': 'north',
-    'MV': 'north',
-    'HH': 'north',
-    'HE': 'west',
-    'NW': 'west',
-    'RP': 'west',
-    'SL': 'west',
-    'SN': 'east',
-    'ST': 'east',
-    'BB': 'east',
-    'TH': 'east',
-    'BE': 'east',
-    'BY': 'south',
-    'BW': 'south',
-    'T': 'south'
-    }
-df_weather_stations['region'] = df_weather_stations['state'].map(state_to_region) # Create a new column 'region' based on the mapping
-
-#reorder columns
-col_order = ["station_id","station_name","latitude","longitude","state","region","begin","end"]
-df_weather_stations = df_weather_stations[col_order]
-
-#load to database
-df_weather_stations.to_sql('dim_active_weather_stations', engine, schema='02_silver', if_exists='replace', index=False)
+def build_active_stations(df_weather_stations):
+    """
+    Builds the dimension of active weather stations from rows of the DWD station catalogue.
+
+    Parameters:
+    df_weather_stations (DataFrame): Rows of raw_dwd_weather_stations_full.
+
+    Returns:
+    DataFrame: One row per active station.
+    """
+    #set dates to select active weather stations
+    active_date = "2024-07-10 00:00:00.000" #should be automated to today - 2 days
+    min_date = "2018-10-01 00:00:00.000"
+
+    #make selection of data depending on active weather stations
+    df_weather_stations.query('Ende >= @active_date and Beginn <= @min_date',inplace=True)
+    df_weather_stations = df_weather_stations[["Stations_ID", "Stationsname","Breite", "Länge", "Bundesland","Beginn" ,"Ende"]]
+
+    #Group entries by max date
+    df_weather_stations = df_weather_stations.groupby("Stations_ID").max().reset_index()
+
+    # Renaming the columns
+    df_weather_stations.rename(columns={
+        'Stations_ID': 'station_id',
+        'Stationsname': 'station_name',
+        'Breite': 'latitude',
+        'Länge': 'longitude',
+        'Bundesland': 'state',
+        'Beginn': 'begin',
+        'Ende': 'end'
+    }, inplace=True)
+
+    # Mapping of states to regions
+    state_to_region = {
+        'SH': 'north',
+        'HB': 'north',
+        'NI': 'north',
+        'MV': 'north',
+        'HH': 'north',
+        'HE': 'west',
+        'NW': 'west',
+        'RP': 'west',
+        'SL': 'west',
+        'SN': 'east',
+        'ST': 'east',
+        'BB': 'east',
+        'TH': 'east',
+        'BE': 'east',
+        'BY': 'south',
+        'BW': 'south',
+        'T': 'south'
+        }
+    df_weather_stations['region'] = df_weather_stations['state'].map(state_to_region) # Create a new column 'region' based on the mapping
+
+    #reorder columns
+    col_order = ["station_id","station_name","latitude","longitude","state","region","begin","end"]
+    df_weather_stations = df_weather_stations[col_order]
+
+    return df_weather_stations
+
+####################### Rebuild the stations changed since the last run #######################
+
+watermark = get_stored_watermark('dim_active_weather_stations', engine)
+dimension_exists = inspect(engine).has_table('dim_active_weather_stations', schema='02_silver')
+
+if watermark is None or not dimension_exists:
+    # First run, build the whole dimension
+    query_string1 = 'SELECT * FROM "01_bronze"."raw_dwd_weather_stations_full"'
+    df_weather_stations = build_active_stations(pd.read_sql(query_string1, engine))
+
+    swap_load(df_weather_stations, '02_silver', 'dim_active_weather_stations', ['station_id'], engine)
+    print(f"Built dim_active_weather_stations with {len(df_weather_stations)} stations.")
+
+    set_stored_watermark('dim_active_weather_stations', pd.Timestamp.now(tz="Europe/Berlin"), engine)
+
+elif not inspect(engine).has_table('raw_dwd_weather_stations_changes', schema='01_bronze'):
+    print("No station changes, dim_active_weather_stations is up to date.")
+
+else:
+    query_string2 = 'SELECT * FROM "01_bronze"."raw_dwd_weather_stations_changes" WHERE changed_at > :watermark'
+    changes = pd.read_sql(text(query_string2), engine, params={"watermark": to_utc(watermark)})
+
+    if len(changes) == 0:
+        print("No station changes, dim_active_weather_stations is up to date.")
+
+    else:
+        changed_ids = [int(station_id) for station_id in changes.Stations_ID.unique()]
+
+        query_string3 = 'SELECT * FROM "01_bronze"."raw_dwd_weather_stations_full" WHERE "Stations_ID" = ANY(:station_ids)'
+        df_weather_stations = build_active_stations(pd.read_sql(text(query_string3), engine, params={"station_ids": changed_ids}))
+
+        # Replace only the rows of changed stations, stations that are not active anymore are removed
+        with engine.begin() as conn:
+            conn.execute(text('DELETE FROM "02_silver"."dim_active_weather_stations" WHERE station_id = ANY(:station_ids)'), {"station_ids": changed_ids})
+            df_weather_stations.to_sql('dim_active_weather_stations', conn, schema='02_silver', if_exists='append', index=False)
+
+        print(f"Updated {len(changed_ids)} stations in dim_active_weather_stations.")
+
+        apply_indexes('02_silver', 'dim_active_weather_stations', engine)
+        set_stored_watermark('dim_active_weather_stations', changes.changed_at.max(), engine)
@@ -1,5 +1,5 @@
 import pandas as pd
-from packages.db_utils import get_engine
+from packages.db_utils import get_engine, swap_load
     
 #Get all active weather stations data
 query_string1 = 'SELECT * FROM "02_silver"."dim_active_weather_stations"'
@@ -16,4 +16,4 @@ used_ids = used_stations.station_id.unique()
 stations_filtered = active_stations[active_stations['station_id'].isin(used_ids)]
 
 #Write to database
-stations_filtered.to_sql('dim_weather_stations', get_engine(), schema='02_silver', if_exists='replace', index=False)
\ No newline at end of file
+swap_load(stations_filtered, '02_silver', 'dim_weather_stations', ['station_id'])
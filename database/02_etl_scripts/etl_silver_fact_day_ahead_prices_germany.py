@@ -1,12 +1,28 @@
 import pandas as pd
-from packages.db_utils import get_engine
+from datetime import timedelta
+from sqlalchemy import text
+from packages.db_utils import get_engine, get_stored_watermark, set_stored_watermark, ensure_table, bulk_upsert, to_utc
+from packages.db_schema import apply_indexes
 
 # Create engine
 engine = get_engine()
 
 #get data    
-query_string1 = 'select * from "01_bronze".raw_energy_charts_day_ahead_prices_germany'
-df_prices = pd.read_sql(query_string1, engine)
+revision_days = 2 #bronze rows of the last days before the watermark can be revised by the api update
+watermark = get_stored_watermark('fact_day_ahead_prices_germany', engine)
+
+if watermark is None:
+    query_string1 = 'select * from "01_bronze".raw_energy_charts_day_ahead_prices_germany'
+    df_prices = pd.read_sql(query_string1, engine)
+else:
+    query_string1 = 'select * from "01_bronze".raw_energy_charts_day_ahead_prices_germany where timestamp >= :since'
+    df_prices = pd.read_sql(text(query_string1), engine, params={"since": to_utc(watermark - timedelta(days=revision_days))})
+
+if len(df_prices) == 0:
+    print("No new data in raw_energy_charts_day_ahead_prices_germany.")
+    raise SystemExit
+
+new_watermark = df_prices['timestamp'].max()
 
 #Change column names
 df_prices.columns = [col.strip().lower().replace(' ', '_') for col in df_prices.columns]
@@ -34,4 +50,10 @@ df_prices = df_prices[new_column_order]
 #Sort Values
 df_prices = df_prices.sort_values(by='timestamp', ascending=False, ignore_index=True)
     
-df_prices.to_sql('fact_day_ahead_prices_germany', engine, schema='02_silver', if_exists='replace', index=False)
+#Export to database, rows of the window replace their previous version
+ensure_table(df_prices, '02_silver', 'fact_day_ahead_prices_germany', ['timestamp'], engine)
+row_count = bulk_upsert(df_prices, '02_silver', 'fact_day_ahead_prices_germany', ['timestamp'], engine)
+apply_indexes('02_silver', 'fact_day_ahead_prices_germany', engine)
+set_stored_watermark('fact_day_ahead_prices_germany', new_watermark, engine)
+
+print(f"fact_day_ahead_prices_germany done! {row_count} rows upserted.")
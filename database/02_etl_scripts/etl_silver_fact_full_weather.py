@@ -1,106 +1,189 @@
 ####################### get packages #######################
 
-import psycopg2
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-import os
+import sys
+import pandas as pd
+from datetime import timedelta
+from sqlalchemy import inspect, text
+from packages.db_utils import get_engine, get_stored_watermark, set_stored_watermark, is_duckdb, to_utc
+from packages.open_meteo_utils import weather_variables
+from packages.db_schema import ensure_monthly_partitions, create_missing_partitions, get_partitions, apply_indexes
 
-# Load login data from .env file
-load_dotenv()
+# Create SQLAlchemy engine
+engine = get_engine()
 
-DB_NAME = os.getenv('DB_NAME')
-DB_USERNAME = os.getenv('DB_USERNAME')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
+full_refresh = "--full-refresh" in sys.argv #rebuild the whole table instead of merging new rows
 
-DB_STRING = f'postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+weather_columns = ",\n    ".join(weather_variables)
+fact_columns = ", ".join(["timestamp", "station_id"] + weather_variables + ["is_forecast", "source_table"])
 
-# Create SQLAlchemy engine
-engine = create_engine(DB_STRING)
-
-# Create a new connection using psycopg2 for non-pandas operations
-conn = psycopg2.connect(
-    database=DB_NAME,
-    user=DB_USERNAME,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=DB_PORT
-)
-
-####################### 1. Get list of coordinates of used weather stations from dim_weather_stations  #######################
-
-try:
-    cursor = conn.cursor()
-    cursor.execute("SELECT version();")
-    record = cursor.fetchone()
-    print("You are connected to -", record, "\n")
-   
-    #recreate view
-    query_string1 = """
-        DROP TABLE IF EXISTS "02_silver".fact_full_weather;
-        
-        CREATE TABLE "02_silver".fact_full_weather AS
-        SELECT DISTINCT ON (timestamp, station_id)
+
+def build_incoming_query(history_filter):
+    """
+    Returns the query that combines history and the latest forecast snapshot to one row per hour and station.
+    History rows win over forecast rows of the same hour.
+
+    Parameters:
+    history_filter (str): WHERE clause for the history rows, e.g. 'loaded_at > :since'.
+
+    Returns:
+    str: Query string.
+    """
+    return f"""
+    SELECT DISTINCT ON (timestamp, station_id)
+        {fact_columns}, now() AS updated_at
+    FROM (
+        SELECT
             timestamp,
             station_id,
-            temperature_2m,
-            relative_humidity_2m,
-            apparent_temperature,
-            precipitation,
-            cloud_cover,
-            wind_speed_10m,
-            wind_direction_10m,
-            direct_radiation,
-            diffuse_radiation,
-            sunshine_duration,
+            {weather_columns},
+            'no' AS is_forecast,
+            'hist' AS source_table
+        FROM "01_bronze".raw_open_meteo_weather_history romwh
+        WHERE {history_filter}
+        UNION ALL
+        SELECT
+            timestamp,
+            station_id,
+            {weather_columns},
             is_forecast,
-            source_table
-        FROM ( 
-            SELECT
-                timestamp,
-                station_id,
-                temperature_2m,
-                relative_humidity_2m,
-                apparent_temperature,
-                precipitation,
-                cloud_cover,
-                wind_speed_10m,
-                wind_direction_10m,
-                direct_radiation,
-                diffuse_radiation,
-                sunshine_duration,
-                'no' AS is_forecast,
-                'hist' AS source_table
-            FROM "01_bronze".raw_open_meteo_weather_history romwh
-            UNION
-            SELECT
-                timestamp,
-                station_id,
-                temperature_2m,
-                relative_humidity_2m,
-                apparent_temperature,
-                precipitation,
-                cloud_cover,
-                wind_speed_10m,
-                wind_direction_10m,
-                direct_radiation,
-                diffuse_radiation,
-                sunshine_duration,
-                is_forecast,
-                'forecast' AS source_table
-            FROM "01_bronze".raw_open_meteo_weather_forecast romwf
-        ) AS combined_weather
-        ORDER BY station_id ASC, timestamp DESC, source_table DESC;       
+            'forecast' AS source_table
+        FROM "01_bronze".raw_open_meteo_weather_forecast romwf
+    ) AS combined_weather
+    ORDER BY timestamp, station_id, source_table DESC
+    """
+
+
+def build_merge_query(table, history_filter):
+    """
+    Returns the query that merges history and the latest forecast snapshot into a fact table.
+    History rows win over forecast rows of the same hour, a forecast never overwrites history.
+
+    Parameters:
+    table (str): Name of the fact table in schema 02_silver.
+    history_filter (str): WHERE clause for the history rows, e.g. 'loaded_at > :since'.
+
+    Returns:
+    str: Query string.
     """
-    cursor.execute(query_string1)
-    conn.commit()   
+    return f"""
+    INSERT INTO "02_silver".{table} ({fact_columns}, updated_at)
+    {build_incoming_query(history_filter)}
+    ON CONFLICT (timestamp, station_id)
+    DO UPDATE SET
+        {", ".join(f"{column} = EXCLUDED.{column}" for column in weather_variables + ["is_forecast", "source_table"])},
+        updated_at = EXCLUDED.updated_at
+    WHERE ({table}.source_table = 'forecast' OR EXCLUDED.source_table = 'hist')
+    AND ({", ".join(f"{table}.{column}" for column in weather_variables + ["source_table"])})
+        IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in weather_variables + ["source_table"])});
+    """
+
+
+def build_duckdb_merge_queries(table, history_filter):
+    """
+    Returns the merge of build_merge_query for DuckDB, which fails on an upsert with a conditional update.
+    The rows that win are selected into a temporary table first and then upserted without a condition.
+
+    Parameters:
+    table (str): Name of the fact table in schema 02_silver.
+    history_filter (str): WHERE clause for the history rows, e.g. 'loaded_at > :since'.
+
+    Returns:
+    list: Query strings, executed in this order in one transaction.
+    """
+    compared = weather_variables + ["source_table"]
+    return [
+        "DROP TABLE IF EXISTS merge_rows;",
+        f"""
+        CREATE TEMPORARY TABLE merge_rows AS
+        SELECT incoming.*
+        FROM ({build_incoming_query(history_filter)}) AS incoming
+        LEFT JOIN "02_silver".{table} existing USING (timestamp, station_id)
+        WHERE existing.station_id IS NULL
+        OR ((existing.source_table = 'forecast' OR incoming.source_table = 'hist')
+            AND ({", ".join(f"existing.{column}" for column in compared)})
+            IS DISTINCT FROM ({", ".join(f"incoming.{column}" for column in compared)}));
+        """,
+        f"""
+        INSERT INTO "02_silver".{table} ({fact_columns}, updated_at)
+        SELECT {fact_columns}, updated_at FROM merge_rows
+        ON CONFLICT (timestamp, station_id)
+        DO UPDATE SET {", ".join(f"{column} = EXCLUDED.{column}" for column in weather_variables + ["is_forecast", "source_table", "updated_at"])};
+        """,
+    ]
+
+
+def create_table_query(table):
+    """
+    Returns the DDL of the fact table with its primary key, partitioned by month on timestamp in PostgreSQL.
+
+    Parameters:
+    table (str): Name of the fact table in schema 02_silver.
+
+    Returns:
+    str: Query string.
+    """
+    variable_columns = ",\n        ".join(f"{variable} DOUBLE PRECISION" for variable in weather_variables)
+    partitioning = "" if is_duckdb(engine) else " PARTITION BY RANGE (timestamp)"
+    return f"""
+    CREATE TABLE IF NOT EXISTS "02_silver".{table} (
+        timestamp TIMESTAMPTZ NOT NULL,
+        station_id BIGINT NOT NULL,
+        {variable_columns},
+        is_forecast TEXT,
+        source_table TEXT,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        CONSTRAINT {table}_pkey PRIMARY KEY (timestamp, station_id)
+    ){partitioning};
+    """
+
+
+watermark = get_stored_watermark('fact_full_weather', engine)
+table_exists = inspect(engine).has_table('fact_full_weather', schema='02_silver')
+
+# History rows are merged by the time they were loaded, so late rows of lagging stations and revised rows of any age are picked up.
+# The watermark is read before merging, rows loaded while this run merges are merged again by the next run.
+with engine.connect() as conn:
+    new_watermark = conn.execute(text('SELECT COALESCE(MAX(loaded_at), now()) FROM "01_bronze".raw_open_meteo_weather_history')).scalar()
+
+####################### 1. Full refresh into a new table that replaces the old one at once #######################
+
+if full_refresh or watermark is None or not table_exists:
+    print("Rebuilding fact_full_weather...")
+    with engine.begin() as conn:
+        first = conn.execute(text('SELECT MIN(timestamp) FROM "01_bronze".raw_open_meteo_weather_history')).scalar()
+        conn.execute(text('DROP TABLE IF EXISTS "02_silver".fact_full_weather_rebuild;'))
+        conn.execute(text(create_table_query('fact_full_weather_rebuild')))
+
+        # Partitions for the whole history and the month ahead for the forecast
+        create_missing_partitions(conn, '02_silver', 'fact_full_weather_rebuild', first or pd.to_datetime("today") - timedelta(days=7), pd.to_datetime("today") + pd.DateOffset(months=1))
+        conn.execute(text(build_merge_query('fact_full_weather_rebuild', 'TRUE')))
+
+        # Readers see either the old or the new table, never a missing one
+        conn.execute(text('DROP TABLE IF EXISTS "02_silver".fact_full_weather;'))
+        conn.execute(text('ALTER TABLE "02_silver".fact_full_weather_rebuild RENAME TO fact_full_weather;'))
+        if not is_duckdb(engine):
+            conn.execute(text('ALTER TABLE "02_silver".fact_full_weather RENAME CONSTRAINT fact_full_weather_rebuild_pkey TO fact_full_weather_pkey;'))
+        for partition in get_partitions(conn, '02_silver', 'fact_full_weather'):
+            conn.execute(text(f'ALTER TABLE "02_silver"."{partition}" RENAME TO "{partition.replace("fact_full_weather_rebuild", "fact_full_weather")}";'))
+
+####################### 2. Merge history rows loaded since the last run #######################
+
+else:
+    print(f"Merging weather loaded since {watermark}...")
+    with engine.connect() as conn:
+        first = conn.execute(text('SELECT MIN(timestamp) FROM "01_bronze".raw_open_meteo_weather_history WHERE loaded_at > :since'), {"since": to_utc(watermark)}).scalar()
+    ensure_monthly_partitions('02_silver', 'fact_full_weather', first or pd.to_datetime("today") - timedelta(days=7), engine=engine)
+    with engine.begin() as conn:
+        if is_duckdb(engine):
+            for query in build_duckdb_merge_queries('fact_full_weather', 'loaded_at > :since'):
+                conn.execute(text(query), {"since": to_utc(watermark)})
+            merged = conn.execute(text("SELECT COUNT(*) FROM merge_rows")).scalar()
+        else:
+            merged = conn.execute(text(build_merge_query('fact_full_weather', 'loaded_at > :since')), {"since": to_utc(watermark)}).rowcount
+    print(f"{merged} rows inserted or updated.")
+
+apply_indexes('02_silver', 'fact_full_weather', engine)
 
-except Exception as error:
-    print("Error while connecting to PostgreSQL:", error)
+set_stored_watermark('fact_full_weather', new_watermark, engine)
 
-finally:
-    if conn:
-        cursor.close()
-        conn.close()
-        print("PostgreSQL connection is closed")
\ No newline at end of file
+print("fact_full_weather done!")
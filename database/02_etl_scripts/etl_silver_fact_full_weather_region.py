@@ -1,32 +1,109 @@
 ####################### get packages #######################
-import pandas as pd
-from packages.db_utils import get_engine
-    
-# Load data from the database using SQLAlchemy engine
-query_string1 = 'SELECT * FROM "02_silver"."fact_full_weather"'
-df_weather = pd.read_sql(query_string1, get_engine())
-
-# Load data from the database using SQLAlchemy engine
-query_string2 = 'SELECT * FROM "02_silver"."dim_weather_stations"'
-df_stations = pd.read_sql(query_string2, get_engine())
-
-df = pd.merge(df_weather, df_stations, on="station_id").sort_values(by=['timestamp','station_id'], ascending=False, ignore_index=True)
-df.timestamp = df.timestamp.dt.tz_convert("Europe/Berlin")
-
-aggregation = {
-    'temperature_2m': 'mean',
-    'relative_humidity_2m': 'mean',
-    'apparent_temperature': 'mean',
-    'precipitation': 'mean',
-    'cloud_cover': 'mean',
-    'wind_speed_10m': 'mean',
-    'wind_direction_10m': 'mean',
-    'direct_radiation': 'mean',
-    'diffuse_radiation': 'mean',
-    'sunshine_duration': 'mean',
-    'is_forecast':'first'
-}
-
-df_weather_region = df.groupby(['timestamp','region']).agg(aggregation).sort_values(by='timestamp', ascending=False).reset_index()
-
-df_weather_region.to_sql('fact_full_weather_region', get_engine(), schema='02_silver', if_exists='replace', index=False)
\ No newline at end of file
+import sys
+from sqlalchemy import inspect, text
+from packages.db_utils import get_engine, get_stored_watermark, set_stored_watermark, is_duckdb, to_utc
+from packages.db_schema import apply_indexes
+from packages.open_meteo_utils import weather_variables
+
+#create engine
+engine = get_engine()
+
+full_refresh = "--full-refresh" in sys.argv #rebuild the whole rollup, e.g. after the stations of a region changed
+
+#mean over all stations of a region, an hour counts as forecast if any station is a forecast
+weather_aggregation = ",\n        ".join(f"AVG(ffw.{variable}) AS {variable}" for variable in weather_variables)
+region_columns = ", ".join(["timestamp", "region"] + weather_variables + ["is_forecast"])
+
+
+def build_rollup_query(table, hours_filter):
+    """
+    Returns the query that aggregates the weather of the stations to regions and upserts the hours into the rollup.
+    Rows are replaced one by one, so readers of the rollup are never blocked.
+
+    Parameters:
+    table (str): Name of the rollup table in schema 02_silver.
+    hours_filter (str): Condition on fact_full_weather ffw selecting the hours to refresh.
+
+    Returns:
+    str: Query string.
+    """
+    return f"""
+    INSERT INTO "02_silver".{table} ({region_columns})
+    SELECT
+        ffw.timestamp,
+        dws.region,
+        {weather_aggregation},
+        MAX(ffw.is_forecast) AS is_forecast
+    FROM "02_silver".fact_full_weather ffw
+    JOIN "02_silver".dim_weather_stations dws ON ffw.station_id = dws.station_id
+    WHERE ffw.timestamp IN (
+        SELECT DISTINCT ffw.timestamp FROM "02_silver".fact_full_weather ffw WHERE {hours_filter}
+    )
+    GROUP BY ffw.timestamp, dws.region
+    ON CONFLICT (timestamp, region)
+    DO UPDATE SET
+        {", ".join(f"{column} = EXCLUDED.{column}" for column in weather_variables + ["is_forecast"])};
+    """
+
+
+def create_table_query(table):
+    """
+    Returns the DDL of the rollup table with one row per hour and region.
+
+    Parameters:
+    table (str): Name of the rollup table in schema 02_silver.
+
+    Returns:
+    str: Query string.
+    """
+    variable_columns = ",\n        ".join(f"{variable} DOUBLE PRECISION" for variable in weather_variables)
+    return f"""
+    CREATE TABLE IF NOT EXISTS "02_silver".{table} (
+        timestamp TIMESTAMPTZ NOT NULL,
+        region TEXT NOT NULL,
+        {variable_columns},
+        is_forecast TEXT,
+        CONSTRAINT {table}_pkey PRIMARY KEY (timestamp, region)
+    );
+    """
+
+
+watermark = get_stored_watermark('fact_full_weather_region', engine)
+table_exists = inspect(engine).has_table('fact_full_weather_region', schema='02_silver')
+
+# Rows of fact_full_weather changed up to now are handled by this run
+with engine.connect() as conn:
+    new_watermark = conn.execute(text('SELECT MAX(updated_at) FROM "02_silver".fact_full_weather')).scalar()
+
+####################### 1. First run, build the rollup next to the old table and replace it at once #######################
+
+if full_refresh or watermark is None or not table_exists:
+    print("Building fact_full_weather_region...")
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS "02_silver".fact_full_weather_region_rebuild;'))
+        conn.execute(text(create_table_query('fact_full_weather_region_rebuild')))
+        conn.execute(text(build_rollup_query('fact_full_weather_region_rebuild', 'TRUE')))
+        conn.execute(text('DROP TABLE IF EXISTS "02_silver".fact_full_weather_region;'))
+        conn.execute(text('ALTER TABLE "02_silver".fact_full_weather_region_rebuild RENAME TO fact_full_weather_region;'))
+        if not is_duckdb(engine):
+            conn.execute(text('ALTER TABLE "02_silver".fact_full_weather_region RENAME CONSTRAINT fact_full_weather_region_rebuild_pkey TO fact_full_weather_region_pkey;'))
+
+####################### 2. Refresh only the hours touched since the last run #######################
+
+elif new_watermark is None or new_watermark <= watermark:
+    print("No new weather data, fact_full_weather_region is up to date.")
+
+else:
+    print(f"Refreshing hours changed since {watermark}...")
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(build_rollup_query('fact_full_weather_region', 'ffw.updated_at > :watermark AND ffw.updated_at <= :new_watermark')),
+            {"watermark": to_utc(watermark), "new_watermark": to_utc(new_watermark)}
+        )
+    print(f"{result.rowcount} region hours refreshed.")
+
+#Recreate indexes and statistics
+apply_indexes('02_silver', 'fact_full_weather_region', engine)
+
+if new_watermark is not None:
+    set_stored_watermark('fact_full_weather_region', new_watermark, engine)
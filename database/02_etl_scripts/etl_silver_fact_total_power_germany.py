@@ -1,12 +1,28 @@
 import pandas as pd
-from packages.db_utils import get_engine
+from datetime import timedelta
+from sqlalchemy import text
+from packages.db_utils import get_engine, get_stored_watermark, set_stored_watermark, ensure_table, bulk_upsert, to_utc
+from packages.db_schema import apply_indexes
 
 #create engine
 engine = get_engine()
 
 #get data
-query_string1 = 'select * from "01_bronze".raw_energy_charts_total_power_germany'
-df_power = pd.read_sql(query_string1, engine)
+revision_days = 2 #bronze rows of the last days before the watermark can be revised by the api update
+watermark = get_stored_watermark('fact_total_power_germany', engine)
+
+if watermark is None:
+    query_string1 = 'select * from "01_bronze".raw_energy_charts_total_power_germany'
+    df_power = pd.read_sql(query_string1, engine)
+else:
+    query_string1 = 'select * from "01_bronze".raw_energy_charts_total_power_germany where timestamp >= :since'
+    df_power = pd.read_sql(text(query_string1), engine, params={"since": to_utc(watermark - timedelta(days=revision_days))})
+
+if len(df_power) == 0:
+    print("No new data in raw_energy_charts_total_power_germany.")
+    raise SystemExit
+
+new_watermark = df_power['timestamp'].max()
 
 #Change column names
 df_power.columns = [col.strip().lower().replace(' / ', '_').replace(' ', '_').replace('(', '').replace(')', '').replace('-', '_').replace('.', '') for col in df_power.columns]
@@ -102,5 +118,10 @@ df_power = df_power[new_column_order]
 #Sort Values
 df_power = df_power.sort_values(by='timestamp', ascending=False, ignore_index=True)
 
-#Export to database
-df_power.to_sql('fact_total_power_germany', engine, schema='02_silver', if_exists='replace', index=False)
\ No newline at end of file
+#Export to database, rows of the window replace their previous version
+ensure_table(df_power, '02_silver', 'fact_total_power_germany', ['timestamp'], engine)
+row_count = bulk_upsert(df_power, '02_silver', 'fact_total_power_germany', ['timestamp'], engine)
+apply_indexes('02_silver', 'fact_total_power_germany', engine)
+set_stored_watermark('fact_total_power_germany', new_watermark, engine)
+
+print(f"fact_total_power_germany done! {row_count} rows upserted.")
\ No newline at end of file
@@ -0,0 +1,159 @@
+####################### get packages #######################
+
+import pandas as pd
+from datetime import timedelta
+from sqlalchemy import inspect, text
+from packages.db_utils import get_engine, get_stored_watermark, set_stored_watermark, to_utc
+from packages.data_quality import check_gaps, check_duplicates, check_nulls, check_range, check_station_completeness
+
+# Create SQLAlchemy engine
+engine = get_engine()
+
+initial_days = 30 #days before the latest timestamp a check reaches back at most, e.g. on the first run or after a full refresh
+results_table = 'data_quality_results'
+
+# Checked tables: key, expected grid, optional series column, column marking changed rows and the checks on the values.
+# Keys enforced by a primary key can not have duplicates, "unique_key": False marks the tables whose key is not enforced.
+quality_tables = {
+    ("01_bronze", "raw_open_meteo_weather_forecast"): {
+        "key": ["timestamp", "station_id"], "grid": "1h", "series": "station_id", "unique_key": False,
+        "not_null": ["temperature_2m"], "ranges": {"relative_humidity_2m": (0, 100), "cloud_cover": (0, 100)},
+    },
+    ("02_silver", "fact_day_ahead_prices_germany"): {
+        "key": ["timestamp"], "grid": "1h",
+        "not_null": ["de_lu"], "ranges": {"de_lu": (-200, None)},
+    },
+    ("02_silver", "fact_total_power_germany"): {
+        "key": ["timestamp"], "grid": "15min",
+        "not_null": ["total_production"], "ranges": {"solar": (0, None), "wind_onshore": (0, None), "wind_offshore": (0, None)},
+    },
+    ("02_silver", "fact_full_weather"): {
+        "key": ["timestamp", "station_id"], "grid": "1h", "series": "station_id", "changed": "updated_at",
+        "not_null": ["temperature_2m"], "ranges": {"relative_humidity_2m": (0, 100), "cloud_cover": (0, 100)},
+        "complete": ("station_id", 'SELECT COUNT(DISTINCT station_id) FROM "02_silver".dim_weather_stations'),
+    },
+    ("02_silver", "fact_full_weather_region"): {
+        "key": ["timestamp", "region"], "grid": "1h", "series": "region",
+        "complete": ("region", 'SELECT COUNT(DISTINCT region) FROM "02_silver".dim_weather_stations'),
+    },
+    ("03_gold", "fact_electricity_market_germany"): {
+        "key": ["timestamp"], "grid": "1h", "unique_key": False,
+        "not_null": ["price_eur_mwh"], "ranges": {"price_eur_mwh": (-200, None)},
+    },
+}
+
+
+def get_window(conn, schema, table, changed, watermark):
+    """
+    Returns the time range of a table that changed since the last check and the watermark after this check.
+    The last checked row is part of the next window, so gaps between two loads are found as well.
+    Windows never reach back more than initial_days before the latest timestamp, e.g. after a full refresh.
+
+    Parameters:
+    conn (Connection): Open SQLAlchemy connection.
+    schema (str): Schema of the table, e.g. '02_silver'.
+    table (str): Name of the table.
+    changed (str): Column marking new or changed rows, 'timestamp' or e.g. 'updated_at'.
+    watermark (Timestamp): Watermark of the last check, None on the first run.
+
+    Returns:
+    tuple: (window start, window end, new watermark), None values if nothing changed.
+    """
+    last_timestamp, last = conn.execute(text(f'SELECT MAX("timestamp"), MAX("{changed}") FROM "{schema}"."{table}"')).one()
+    if last is None:
+        return None, None, None
+
+    oldest = pd.Timestamp(last_timestamp) - timedelta(days=initial_days)
+    params = {"oldest": to_utc(oldest)}
+    condition = '"timestamp" >= :oldest'
+
+    if watermark is not None:
+        params["since"] = to_utc(watermark)
+        condition += ' AND "timestamp" >= :since' if changed == "timestamp" else f' AND "{changed}" > :since'
+
+    start, end = conn.execute(
+        text(f'SELECT MIN("timestamp"), MAX("timestamp") FROM "{schema}"."{table}" WHERE {condition}'),
+        params
+    ).one()
+    return start, end, last
+
+
+def run_checks(df, config, expected=None):
+    """
+    Runs the configured checks on the rows of a window.
+
+    Parameters:
+    df (DataFrame): Rows of the window.
+    config (dict): Entry of quality_tables.
+    expected (int): Number of series every hour should have, None to skip the completeness check.
+
+    Returns:
+    list: (check name, failed count, details) of every check.
+    """
+    results = [("gaps", *check_gaps(df, "timestamp", config["grid"], config.get("series")))]
+    if not config.get("unique_key", True):
+        results.append(("duplicate_keys", *check_duplicates(df, config["key"])))
+    for column in config.get("not_null", []):
+        results.append((f"nulls_{column}", *check_nulls(df, column)))
+    for column, (lower, upper) in config.get("ranges", {}).items():
+        results.append((f"range_{column}", *check_range(df, column, lower, upper)))
+    if expected is not None:
+        results.append((f"completeness_{config['complete'][0]}", *check_station_completeness(df, expected, station_column=config["complete"][0])))
+    return results
+
+
+####################### 1. Check the window of every table loaded since the last check #######################
+
+inspector = inspect(engine)
+checked_at = pd.Timestamp.now(tz="Europe/Berlin")
+results = []
+watermarks = {}
+
+for (schema, table), config in quality_tables.items():
+    if not inspector.has_table(table, schema=schema):
+        continue
+
+    name = f"data_quality.{table}"
+    with engine.connect() as conn:
+        start, end, new_watermark = get_window(conn, schema, table, config.get("changed", "timestamp"), get_stored_watermark(name, engine))
+        expected = conn.execute(text(config["complete"][1])).scalar() if "complete" in config else None
+
+    if start is None:
+        print(f"{schema}.{table}: no new rows.")
+        continue
+
+    df = pd.read_sql(
+        text(f'SELECT * FROM "{schema}"."{table}" WHERE "timestamp" >= :start AND "timestamp" <= :end'),
+        engine, params={"start": to_utc(start), "end": to_utc(end)}
+    )
+
+    for check, failed_count, details in run_checks(df, config, expected):
+        results.append({
+            "check_name": check,
+            "schema_name": schema,
+            "table_name": table,
+            "window_start": start,
+            "window_end": end,
+            "row_count": len(df),
+            "failed_count": failed_count,
+            "details": details,
+            "checked_at": checked_at,
+        })
+        if failed_count > 0:
+            print(f"{schema}.{table} {check}: {failed_count} failed, e.g. {details}")
+
+    watermarks[name] = new_watermark
+    print(f"{schema}.{table}: {len(df)} rows from {start} to {end} checked.")
+
+####################### 2. Store results and watermarks #######################
+
+if results:
+    df_results = pd.DataFrame(results)
+    df_results["window_start"] = pd.to_datetime(df_results["window_start"], utc=True)
+    df_results["window_end"] = pd.to_datetime(df_results["window_end"], utc=True)
+    df_results.to_sql(results_table, engine, schema='02_silver', if_exists='append', index=False)
+
+for name, watermark in watermarks.items():
+    set_stored_watermark(name, watermark, engine)
+
+print(f"Data quality done! {sum(result['failed_count'] > 0 for result in results)} of {len(results)} checks failed.")
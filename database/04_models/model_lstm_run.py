@@ -4,7 +4,7 @@ from sklearn.preprocessing import MinMaxScaler
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import LSTM, Dense, Dropout, Bidirectional, Input
 from dateutil.relativedelta import relativedelta
-from packages.db_utils import get_engine
+from packages.db_utils import get_engine, swap_load
 
 # Define your queries -> set your table name here
 query1 = 'SELECT * FROM "02_silver"."fact_full_weather_region"'
@@ -193,6 +193,6 @@ final_predictions['prediction'] = np.concatenate((preds_24, preds_48, preds_72,
 final_predictions.sort_values(by=['timestamp', 'source']).reset_index(drop=True)
 
 # Export to DB
-final_predictions.to_sql('fact_predicted_values', get_engine(), schema='02_silver', if_exists='replace', index=False)
+swap_load(final_predictions, '02_silver', 'fact_predicted_values')
 
 print('Operation complete.')
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+Runs the ingestion, ETL and model scripts in the order of their dependencies, independent branches run at the same time.
+
+Every step is a script started in its own process with the repository root on the PYTHONPATH.
+Status and duration of every step are stored in .pipeline_state.json and the output in .pipeline_logs/<step>.log.
+
+    python -m database.run_pipeline
+    python -m database.run_pipeline --resume          # rerun only failed steps and the steps after them
+    python -m database.run_pipeline --only fact_full_weather gold
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+state_file = os.path.join(root, ".pipeline_state.json")
+log_dir = os.path.join(root, ".pipeline_logs")
+
+# step: (script, steps it depends on)
+steps = {
+    "dwd_weather_stations": ("database/01_api_ingestion/url-dwd_weather_stations_txt.py", []),
+    "dim_active_weather_stations": ("database/02_etl_scripts/etl_silver_dim_active_weather_stations.py", ["dwd_weather_stations"]),
+    "dim_weather_stations": ("database/02_etl_scripts/etl_silver_dim_weather_stations.py", ["dim_active_weather_stations"]),
+    "weather_history": ("database/01_api_ingestion/api-open_meteo_history_daily_update.py", ["dim_weather_stations"]),
+    "weather_forecast": ("database/01_api_ingestion/api_open_meteo_forecast_daily_update.py", ["dim_active_weather_stations"]),
+    "day_ahead_prices": ("database/01_api_ingestion/api_energy_charts_day_ahead_prices_germany_update.py", []),
+    "total_power": ("database/01_api_ingestion/api_energy_charts_power_production_germany_update.py", []),
+    "fact_day_ahead_prices": ("database/02_etl_scripts/etl_silver_fact_day_ahead_prices_germany.py", ["day_ahead_prices"]),
+    "fact_total_power": ("database/02_etl_scripts/etl_silver_fact_total_power_germany.py", ["total_power"]),
+    "fact_full_weather": ("database/02_etl_scripts/etl_silver_fact_full_weather.py", ["weather_history", "weather_forecast"]),
+    "fact_full_weather_region": ("database/02_etl_scripts/etl_silver_fact_full_weather_region.py", ["fact_full_weather", "dim_weather_stations"]),
+    "gold": ("database/02_etl_scripts/etl_gold_electricity_market_germany.py", ["fact_day_ahead_prices", "fact_total_power", "fact_full_weather"]),
+    "data_quality": ("database/03_data_quality/dq_medallion_checks.py", ["gold", "fact_full_weather_region"]),
+    "model": ("database/04_models/model_lstm_run.py", ["gold", "fact_full_weather_region"]),
+    "analytics_snapshot": ("packages/analytics_snapshot.py", ["gold", "fact_full_weather_region"]),
+}
+
+
+def downstream(names):
+    """
+    Returns the given steps and every step that depends on them directly or indirectly.
+
+    Parameters:
+    names (iterable): Names of steps.
+
+    Returns:
+    set: Names of the steps and their dependents.
+    """
+    selected = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for name, (_, dependencies) in steps.items():
+            if name not in selected and selected.intersection(dependencies):
+                selected.add(name)
+                changed = True
+    return selected
+
+
+def run_step(name):
+    """
+    Runs the script of a step in its own process and writes its output to the log directory.
+
+    Parameters:
+    name (str): Name of the step.
+
+    Returns:
+    dict: Status, return code, start time and duration in seconds of the step.
+    """
+    script = steps[name][0]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+
+    started = time.time()
+    with open(os.path.join(log_dir, f"{name}.log"), "w") as log:
+        returncode = subprocess.call([sys.executable, script], cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    return {
+        "status": "done" if returncode == 0 else "failed",
+        "returncode": returncode,
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)),
+        "duration": round(time.time() - started, 1),
+    }
+
+
+def run_pipeline(selected, state, max_workers=4):
+    """
+    Runs the selected steps as soon as all of their dependencies are done.
+    Steps after a failed step are skipped, independent branches keep running.
+
+    Parameters:
+    selected (set): Names of the steps to run, other steps count as done.
+    state (dict): State of the previous run, updated in place and saved after every step.
+    max_workers (int): Maximum number of steps running at the same time.
+
+    Returns:
+    dict: The updated state.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    pending = set(selected)
+    finished = set(steps) - pending
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # Skip steps whose dependencies failed, start steps whose dependencies are done
+            for name in sorted(pending):
+                dependencies = steps[name][1]
+                if any(state.get(dependency, {}).get("status") in ("failed", "skipped") and dependency not in finished for dependency in dependencies):
+                    state[name] = {"status": "skipped"}
+                    pending.discard(name)
+                elif all(dependency in finished for dependency in dependencies):
+                    print(f"Starting {name}...")
+                    running[executor.submit(run_step, name)] = name
+                    pending.discard(name)
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                state[name] = future.result()
+                print(f"{name} {state[name]['status']} after {state[name]['duration']}s")
+                if state[name]["status"] == "done":
+                    finished.add(name)
+
+            with open(state_file, "w") as file:
+                json.dump(state, file, indent=2)
+
+    with open(state_file, "w") as file:
+        json.dump(state, file, indent=2)
+
+    return state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ingestion, ETL and model scripts in dependency order.")
+    parser.add_argument("--resume", action="store_true", help="rerun only failed or skipped steps of the last run and the steps after them")
+    parser.add_argument("--only", nargs="+", choices=list(steps), help="run only these steps and the steps after them")
+    parser.add_argument("--max-workers", type=int, default=4, help="maximum number of steps running at the same time")
+    args = parser.parse_args()
+
+    state = {}
+    if os.path.exists(state_file):
+        with open(state_file) as file:
+            state = json.load(file)
+
+    if args.resume:
+        selected = downstream(name for name in steps if state.get(name, {}).get("status") != "done")
+    elif args.only:
+        selected = downstream(args.only)
+    else:
+        selected = set(steps)
+
+    for name in selected:
+        state.pop(name, None)
+
+    load_dotenv(os.path.join(root, ".env"))
+
+    # A DuckDB file can only be opened by one process for writing, so steps run one after another
+    max_workers = 1 if os.getenv("DB_BACKEND") == "duckdb" else args.max_workers
+
+    started = time.time()
+    state = run_pipeline(selected, state, max_workers=max_workers)
+
+    print(f"\nPipeline finished after {round(time.time() - started, 1)}s")
+    for name in steps:
+        if name in selected:
+            step = state.get(name, {})
+            print(f"{name:30} {step.get('status', '-'):8} {step.get('duration', '')}")
+
+    sys.exit(1 if any(state.get(name, {}).get("status") != "done" for name in selected) else 0)
@@ -0,0 +1,200 @@
+"""
+Columnar snapshot of the medallion tables for notebooks and local analysis.
+
+Tables are exported to data/snapshot/<schema>/<table>/<YYYY-MM>.parquet, tables without a timestamp to all.parquet.
+Every export only rewrites the months that changed since the last export, see manifest.json.
+get_data_from_snapshot runs the same queries as get_data_from_db with DuckDB on the snapshot:
+
+    python -m packages.analytics_snapshot
+    df = get_data_from_snapshot('SELECT * FROM "02_silver".fact_day_ahead_prices_germany')
+"""
+import glob
+import json
+import os
+import pandas as pd
+from sqlalchemy import inspect, text
+from packages.db_utils import get_engine, to_utc
+from packages.date_utils import monthly_windows
+
+# DuckDB is only needed to query the snapshot, not to export it
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+snapshot_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "snapshot")
+
+timezone = "Europe/Berlin"
+
+# Exported tables with the column the monthly files are cut on, None for small tables exported as a whole
+snapshot_tables = {
+    ("01_bronze", "raw_open_meteo_weather_history"): "timestamp",
+    ("01_bronze", "raw_open_meteo_weather_forecast_snapshots"): "timestamp_fetched",
+    ("01_bronze", "raw_energy_charts_day_ahead_prices_germany"): "timestamp",
+    ("01_bronze", "raw_energy_charts_total_power_germany"): "timestamp",
+    ("01_bronze", "raw_dwd_weather_stations_full"): None,
+    ("02_silver", "dim_active_weather_stations"): None,
+    ("02_silver", "dim_weather_stations"): None,
+    ("02_silver", "fact_day_ahead_prices_germany"): "timestamp",
+    ("02_silver", "fact_total_power_germany"): "timestamp",
+    ("02_silver", "fact_full_weather"): "timestamp",
+    ("02_silver", "fact_full_weather_region"): "timestamp",
+    ("02_silver", "fact_predicted_values"): None,
+    ("03_gold", "fact_electricity_market_germany"): "timestamp",
+}
+
+revision_days = 7 #days before the last export that are exported again, silver tables revise the last week
+
+
+def read_manifest(directory=snapshot_dir):
+    """
+    Returns the manifest of the snapshot with the watermark of every exported table.
+
+    Parameters:
+    directory (str): Directory of the snapshot.
+
+    Returns:
+    dict: {"<schema>.<table>": {"watermark": str, "exported_at": str}}.
+    """
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_parquet(df, path):
+    """
+    Writes a DataFrame to a Parquet file, readers never see a half written file.
+
+    Parameters:
+    df (DataFrame): The data to write.
+    path (str): Path of the Parquet file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_parquet(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_table(schema, table, column, watermark=None, engine=None, directory=snapshot_dir):
+    """
+    Exports a table to monthly Parquet files, only months from the watermark minus the revision window onwards are written.
+
+    Parameters:
+    schema (str): Schema of the table, e.g. '02_silver'.
+    table (str): Name of the table.
+    column (str): Timestamp column the files are cut on, None to export the whole table to all.parquet.
+    watermark (str): Latest timestamp of the previous export, None to export everything.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+    directory (str): Directory of the snapshot.
+
+    Returns:
+    str: New watermark, None for tables exported as a whole.
+    """
+    engine = engine or get_engine()
+    table_dir = os.path.join(directory, schema, table)
+
+    if column is None:
+        write_parquet(pd.read_sql(f'SELECT * FROM "{schema}"."{table}"', engine), os.path.join(table_dir, "all.parquet"))
+        return None
+
+    with engine.connect() as conn:
+        first, last = conn.execute(text(f'SELECT MIN("{column}"), MAX("{column}") FROM "{schema}"."{table}"')).one()
+    if first is None:
+        return watermark
+
+    start = pd.Timestamp(first) if watermark is None else max(pd.Timestamp(first), pd.Timestamp(watermark) - pd.Timedelta(days=revision_days))
+    start = start.tz_convert(timezone).strftime("%Y-%m-01")
+    end = (pd.Timestamp(last).tz_convert(timezone) + pd.offsets.MonthBegin(1)).strftime("%Y-%m-%d")
+
+    # One month in memory at a time, every touched month is rewritten as a whole
+    query = f'SELECT * FROM "{schema}"."{table}" WHERE "{column}" >= :start AND "{column}" < :end'
+    for window_start, window_end in monthly_windows(start, end):
+        df = pd.read_sql(text(query), engine, params={
+            "start": to_utc(window_start, timezone),
+            "end": to_utc(window_end, timezone)
+        })
+        if len(df) > 0:
+            write_parquet(df, os.path.join(table_dir, f"{window_start[:7]}.parquet"))
+            print(f"Exported {schema}.{table} {window_start[:7]}: {len(df)} rows")
+
+    return pd.Timestamp(last).isoformat()
+
+
+def export_snapshot(tables=None, engine=None, directory=snapshot_dir):
+    """
+    Exports the medallion tables incrementally and updates the manifest after every table.
+
+    Parameters:
+    tables (dict): Tables to export like snapshot_tables, defaults to all of them.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+    directory (str): Directory of the snapshot.
+
+    Returns:
+    dict: The updated manifest.
+    """
+    engine = engine or get_engine()
+    inspector = inspect(engine)
+    manifest = read_manifest(directory)
+
+    for (schema, table), column in (tables or snapshot_tables).items():
+        if not (inspector.has_table(table, schema=schema) or table in inspector.get_view_names(schema=schema)):
+            continue
+
+        name = f"{schema}.{table}"
+        watermark = export_table(schema, table, column, manifest.get(name, {}).get("watermark"), engine, directory)
+        manifest[name] = {"watermark": watermark, "exported_at": pd.Timestamp.now(tz=timezone).isoformat()}
+
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "manifest.json"), "w") as file:
+            json.dump(manifest, file, indent=2)
+
+    return manifest
+
+
+def get_snapshot_connection(directory=snapshot_dir):
+    """
+    Returns an in-memory DuckDB connection with a view for every exported table, named like in Postgres.
+
+    Parameters:
+    directory (str): Directory of the snapshot.
+
+    Returns:
+    DuckDBPyConnection: Connection to query the snapshot with.
+    """
+    if duckdb is None:
+        raise ImportError("duckdb is required to query the snapshot, install it with 'pip install duckdb'")
+
+    conn = duckdb.connect()
+    for table_dir in sorted(glob.glob(os.path.join(directory, "*", "*"))):
+        if not glob.glob(os.path.join(table_dir, "*.parquet")):
+            continue
+        schema, table = table_dir.split(os.sep)[-2:]
+        conn.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+        conn.execute(f"""CREATE VIEW "{schema}"."{table}" AS SELECT * FROM read_parquet('{os.path.join(table_dir, "*.parquet")}', union_by_name = true)""")
+    return conn
+
+
+def get_data_from_snapshot(sql_string):
+    """
+    Runs a SQL query on the local Parquet snapshot and returns a DataFrame, a drop-in replacement for get_data_from_db.
+
+    Parameters:
+    sql_string (str): The SQL query to execute.
+
+    Returns:
+    DataFrame: A pandas DataFrame containing the results of the query.
+    """
+    try:
+        conn = get_snapshot_connection()
+        df = conn.execute(sql_string).df()
+        conn.close()
+        return df
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    export_snapshot()
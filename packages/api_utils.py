@@ -0,0 +1,209 @@
+import asyncio
+import json
+import threading
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from retry_requests import retry
+from packages.response_cache import ResponseCache, CachingAdapter
+from dotenv import load_dotenv
+from urllib.parse import urlsplit
+
+# orjson parses the large API responses much faster, the standard library is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def api_url(url):
+    """
+    Returns the url to call for an API endpoint. If API_REPLAY_URL is set in the .env file,
+    requests are routed to the local replay server instead, e.g. http://localhost:8000/<host>/<path>.
+
+    Parameters:
+    url (str): Url of the live endpoint, e.g. "https://archive-api.open-meteo.com/v1/archive".
+
+    Returns:
+    str: Url of the live endpoint or of the replay server.
+    """
+    load_dotenv()
+    replay_url = os.getenv('API_REPLAY_URL')
+
+    if not replay_url:
+        return url
+
+    parts = urlsplit(url)
+    return f"{replay_url.rstrip('/')}/{parts.netloc}{parts.path}"
+
+
+def parse_json(response):
+    """
+    Parses the JSON body of an API response, with orjson if it is installed.
+
+    Parameters:
+    response (Response): Response of a requests call.
+
+    Returns:
+    dict or list: The parsed JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return json.loads(response.content)
+
+
+def get_retry_session(pool_size=10, recent_ttl=3600):
+    """
+    Creates a cached requests session with retry on error whose connection pool can be shared by concurrent requests.
+    Responses for finished date windows are cached indefinitely, recent windows for `recent_ttl` seconds.
+    Nothing is cached if API_REPLAY_URL routes the requests to the replay server.
+
+    Parameters:
+    pool_size (int): Maximum number of connections kept open per host.
+    recent_ttl (float): Seconds responses of recent or open date windows stay cached.
+
+    Returns:
+    Session: A requests session with cache, retry and connection pooling.
+    """
+    # Setup the API client with retry on error, rate limits and unavailable servers are retried after their Retry-After header
+    retry_session = retry(requests.Session(), retries=5, backoff_factor=0.2, status_to_retry=(429, 500, 502, 503, 504))
+
+    # Requests to the replay server are not cached, so benchmarks see its latency and injected errors
+    load_dotenv()
+    if os.getenv('API_REPLAY_URL'):
+        for prefix, adapter in list(retry_session.adapters.items()):
+            retry_session.mount(prefix, HTTPAdapter(max_retries=adapter.max_retries, pool_maxsize=pool_size))
+        return retry_session
+
+    # Remount the adapters with the response cache and a bigger pool but the same retry policy
+    cache = ResponseCache('.response_cache.sqlite')
+    for prefix, adapter in list(retry_session.adapters.items()):
+        retry_session.mount(prefix, CachingAdapter(cache, recent_ttl=recent_ttl, max_retries=adapter.max_retries, pool_maxsize=pool_size))
+
+    return retry_session
+
+
+def fetch_concurrently(fetch_function, jobs, concurrency=10, on_result=None):
+    """
+    Calls a blocking fetch function for every job with at most `concurrency` requests in flight.
+
+    Parameters:
+    fetch_function (callable): Function doing one API request, e.g. fetch_weather_data.
+    jobs (list): List of argument tuples, one tuple per call of fetch_function.
+    concurrency (int): Maximum number of simultaneous requests.
+    on_result (callable): Optional function called with each result as soon as its job is done,
+        e.g. to load it into the database. Its return value replaces the result, so finished
+        data does not have to be kept in memory.
+
+    Returns:
+    list: Results of fetch_function (or on_result) in the same order as jobs.
+    """
+    async def run_all(executor):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(args):
+            async with semaphore:
+                result = await loop.run_in_executor(executor, fetch_function, *args)
+                if on_result is not None:
+                    result = await loop.run_in_executor(executor, on_result, result)
+                return result
+
+        return await asyncio.gather(*(run_one(args) for args in jobs))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return asyncio.run(run_all(executor))
+
+
+def stream_to_database(fetch_function, jobs, load_function, concurrency=10, queue_size=4):
+    """
+    Fetches jobs concurrently and streams every result through a bounded queue to a single writer,
+    so loading into the database overlaps with the requests and only a few batches are held in memory.
+
+    Parameters:
+    fetch_function (callable): Function doing one API request, e.g. fetch_weather_data.
+    jobs (list): List of argument tuples, one tuple per call of fetch_function.
+    load_function (callable): Function loading one result into the database, e.g. bulk_upsert.
+    concurrency (int): Maximum number of simultaneous requests.
+    queue_size (int): Maximum number of fetched results waiting for the writer.
+
+    Returns:
+    list: Return values of load_function, in the order the results were loaded.
+    """
+    async def run_all(executor, writer_executor):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        queue = asyncio.Queue(maxsize=queue_size)
+
+        async def produce(args):
+            # The slot is only released once the result is queued, which caps memory when the writer is behind
+            async with semaphore:
+                result = await loop.run_in_executor(executor, fetch_function, *args)
+                await queue.put(result)
+
+        async def consume():
+            loaded = []
+            while True:
+                result = await queue.get()
+                if result is None:
+                    return loaded
+                loaded.append(await loop.run_in_executor(writer_executor, load_function, result))
+
+        writer = asyncio.create_task(consume())
+        producers = asyncio.gather(*(produce(args) for args in jobs))
+        done, _ = await asyncio.wait([writer, producers], return_when=asyncio.FIRST_COMPLETED)
+
+        # The writer only finishes before the producers if it failed, stop fetching as nothing empties the queue anymore
+        if writer in done and not producers.done():
+            producers.cancel()
+            await asyncio.gather(producers, return_exceptions=True)
+            writer.result()
+
+        await producers
+        await queue.put(None)
+        return await writer
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, ThreadPoolExecutor(max_workers=1) as writer_executor:
+        return asyncio.run(run_all(executor, writer_executor))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket to keep API calls within a quota.
+
+    Parameters:
+    rate (float): Tokens added per second, i.e. the sustained number of calls per second.
+    capacity (float): Maximum number of tokens, i.e. the allowed burst.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until the requested number of tokens is available and takes them from the bucket.
+
+        Parameters:
+        tokens (float): Cost of the call, requests bigger than the bucket wait for a full bucket.
+        """
+        tokens = min(tokens, self.capacity)
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
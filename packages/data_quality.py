@@ -0,0 +1,126 @@
+"""
+Vectorized data-quality checks on the window of a table that was loaded since the last check.
+
+Every check takes a DataFrame and returns the number of failed rows and a short description of the first failures,
+so a whole window is checked with a few pandas operations instead of row by row.
+"""
+import json
+from itertools import islice
+import pandas as pd
+
+max_examples = 5 #failures listed in the details of a check
+
+
+def describe(values):
+    """
+    Returns the first failures of a check as short JSON text for the results table.
+
+    Parameters:
+    values (iterable): Failed values, e.g. timestamps or keys.
+
+    Returns:
+    str: JSON list with up to max_examples values, None if there are none.
+    """
+    examples = [str(value) for value in islice(values, max_examples)]
+    return json.dumps(examples) if examples else None
+
+
+def check_gaps(df, column, freq, group=None):
+    """
+    Counts the points of the expected grid that are missing between the first and the last row of the window.
+
+    Parameters:
+    df (DataFrame): Rows of the window.
+    column (str): Timestamp column, e.g. 'timestamp'.
+    freq (str): Expected distance of two rows, e.g. '1h' or '15min'.
+    group (str): Optional column with one series per value, e.g. 'station_id'.
+
+    Returns:
+    tuple: (number of missing points, details with the start of the first gaps).
+    """
+    step = pd.Timedelta(freq)
+    df = df.drop_duplicates([column] if group is None else [group, column]).sort_values([column] if group is None else [group, column])
+
+    # Distance to the previous row of the same series, in absolute time so DST changes are no gaps
+    previous = df[column].shift() if group is None else df.groupby(group)[column].shift()
+    distance = df[column] - previous
+    gaps = distance > step
+
+    missing = int(((distance[gaps] / step).round() - 1).sum())
+    starts = previous[gaps] + step
+    if group is not None:
+        starts = df.loc[gaps, group].astype(str) + " " + starts.astype(str)
+    return missing, describe(starts)
+
+
+def check_duplicates(df, key_columns):
+    """
+    Counts rows whose key already appears in an earlier row of the window.
+
+    Parameters:
+    df (DataFrame): Rows of the window.
+    key_columns (list): Columns that identify a row, e.g. ['timestamp', 'station_id'].
+
+    Returns:
+    tuple: (number of duplicate rows, details with the first duplicate keys).
+    """
+    duplicated = df.duplicated(key_columns)
+    keys = df.loc[duplicated, key_columns].astype(str).itertuples(index=False)
+    return int(duplicated.sum()), describe(" ".join(key) for key in keys)
+
+
+def check_nulls(df, column, key_column="timestamp"):
+    """
+    Counts rows without a value in a column.
+
+    Parameters:
+    df (DataFrame): Rows of the window.
+    column (str): Column that has to be filled, e.g. 'price_eur_mwh'.
+    key_column (str): Column listed in the details, e.g. 'timestamp'.
+
+    Returns:
+    tuple: (number of rows with null, details with the first of them).
+    """
+    nulls = df[column].isna()
+    return int(nulls.sum()), describe(df.loc[nulls, key_column])
+
+
+def check_range(df, column, lower=None, upper=None, key_column="timestamp"):
+    """
+    Counts rows with a value outside of the plausible range of a column, nulls are left to check_nulls.
+
+    Parameters:
+    df (DataFrame): Rows of the window.
+    column (str): Checked column, e.g. 'price_eur_mwh'.
+    lower (float): Smallest plausible value, None for no lower bound.
+    upper (float): Largest plausible value, None for no upper bound.
+    key_column (str): Column listed in the details, e.g. 'timestamp'.
+
+    Returns:
+    tuple: (number of rows out of range, details with the first of them).
+    """
+    outside = pd.Series(False, index=df.index)
+    if lower is not None:
+        outside |= df[column] < lower
+    if upper is not None:
+        outside |= df[column] > upper
+    failed = df[outside]
+    return int(outside.sum()), describe(failed[key_column].astype(str) + " " + failed[column].astype(str))
+
+
+def check_station_completeness(df, expected, column="timestamp", station_column="station_id"):
+    """
+    Counts the hours of the window in which fewer stations than expected have a row.
+
+    Parameters:
+    df (DataFrame): Rows of the window.
+    expected (int): Number of stations every hour should have.
+    column (str): Timestamp column, e.g. 'timestamp'.
+    station_column (str): Column with the station, e.g. 'station_id'.
+
+    Returns:
+    tuple: (number of incomplete hours, details with the first of them and their station count).
+    """
+    stations = df.groupby(column)[station_column].nunique()
+    incomplete = stations[stations < expected]
+    return int(len(incomplete)), describe(f"{timestamp} {count}/{expected}" for timestamp, count in incomplete.items())
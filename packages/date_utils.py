@@ -0,0 +1,25 @@
+import pandas as pd
+
+
+def monthly_windows(start, end):
+    """
+    Splits a date range into calendar month windows.
+
+    Parameters:
+    start (str): First day of the range, formatted as YYYY-MM-DD.
+    end (str): Last day of the range, formatted as YYYY-MM-DD.
+
+    Returns:
+    list: List of (start, end) tuples formatted as YYYY-MM-DD, each window ends on the first day of the next month.
+    """
+    start = pd.to_datetime(start)
+    end = pd.to_datetime(end)
+    month_starts = pd.date_range(start.to_period('M').to_timestamp(), end, freq='MS')
+
+    windows = []
+    for month_start in month_starts:
+        window_start = max(month_start, start)
+        window_end = min(month_start + pd.offsets.MonthBegin(1), end)
+        windows.append((window_start.strftime("%Y-%m-%d"), window_end.strftime("%Y-%m-%d")))
+
+    return windows
@@ -0,0 +1,303 @@
+import re
+import pandas as pd
+from sqlalchemy import inspect, text
+from packages.db_utils import get_engine, is_duckdb
+
+# Fact tables that are range partitioned by month on their timestamp column
+partitioned_tables = {
+    ("01_bronze", "raw_open_meteo_weather_history"): "timestamp",
+    ("01_bronze", "raw_energy_charts_total_power_germany"): "timestamp",
+    ("02_silver", "fact_full_weather"): "timestamp",
+}
+
+archive_schema = "99_archive"
+
+timezone = "Europe/Berlin"
+
+
+def month_bound(month):
+    """
+    Returns the start of a month in local time as timestamptz literal for a partition bound.
+
+    Parameters:
+    month (Timestamp): Any point in time within the month.
+
+    Returns:
+    str: Literal like '2024-01-01 00:00:00 Europe/Berlin'.
+    """
+    return f"'{pd.Timestamp(month).strftime('%Y-%m-01')} 00:00:00 {timezone}'"
+
+
+def local_time(point):
+    """
+    Converts a point in time to naive local time, the time the partitions are cut in.
+
+    Parameters:
+    point (str or Timestamp): Point in time, naive values are taken as local time.
+
+    Returns:
+    Timestamp: Naive local time.
+    """
+    point = pd.Timestamp(point)
+    return point if point.tzinfo is None else point.tz_convert(timezone).tz_localize(None)
+
+
+def get_partitions(conn, schema, table):
+    """
+    Returns the partitions of a partitioned table.
+
+    Parameters:
+    conn (Connection): Open SQLAlchemy connection.
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the partitioned table.
+
+    Returns:
+    list: Names of the partitions, empty if the table is not partitioned.
+    """
+    if not is_partitioned(conn, schema, table):
+        return []
+
+    query = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+    JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+    JOIN pg_namespace ON parent.relnamespace = pg_namespace.oid
+    WHERE pg_namespace.nspname = :schema AND parent.relname = :table
+    ORDER BY child.relname;
+    """
+    return [row[0] for row in conn.execute(text(query), {"schema": schema, "table": table})]
+
+
+def is_partitioned(conn, schema, table):
+    """
+    Checks if a table is a partitioned table.
+
+    Parameters:
+    conn (Connection): Open SQLAlchemy connection.
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the table.
+
+    Returns:
+    bool: True if the table is partitioned.
+    """
+    # DuckDB has no declarative partitioning, its row groups are pruned by min/max statistics instead
+    if conn.dialect.name == "duckdb":
+        return False
+
+    query = """
+    SELECT 1
+    FROM pg_partitioned_table
+    JOIN pg_class ON pg_partitioned_table.partrelid = pg_class.oid
+    JOIN pg_namespace ON pg_class.relnamespace = pg_namespace.oid
+    WHERE pg_namespace.nspname = :schema AND pg_class.relname = :table;
+    """
+    return conn.execute(text(query), {"schema": schema, "table": table}).first() is not None
+
+
+def create_missing_partitions(conn, schema, table, start, end):
+    """
+    Creates the monthly partitions of a partitioned table that are missing for a time range.
+
+    Parameters:
+    conn (Connection): Open SQLAlchemy connection, the partitions are created in its transaction.
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the partitioned table.
+    start (str or Timestamp): First point in time that has to be covered.
+    end (str or Timestamp): Last point in time that has to be covered.
+
+    Returns:
+    int: Number of created partitions.
+    """
+    if not is_partitioned(conn, schema, table):
+        return 0
+
+    start, end = [local_time(point) for point in (start, end)]
+    months = pd.period_range(start.to_period('M'), end.to_period('M'), freq='M')
+
+    # Partitions keep their month suffix when the table is renamed, e.g. after a rebuild
+    existing = {match.group(1) for name in get_partitions(conn, schema, table) if (match := re.search(r"_p(\d{4}_\d{2})$", name))}
+
+    created = 0
+    for month in months:
+        if month.strftime('%Y_%m') in existing:
+            continue
+        conn.execute(text(f"""
+            CREATE TABLE "{schema}"."{table}_p{month.strftime('%Y_%m')}"
+            PARTITION OF "{schema}"."{table}"
+            FOR VALUES FROM ({month_bound(month.to_timestamp())}) TO ({month_bound((month + 1).to_timestamp())});
+        """))
+        created += 1
+
+    return created
+
+
+def ensure_monthly_partitions(schema, table, start, end=None, months_ahead=1, engine=None):
+    """
+    Creates the monthly partitions of a partitioned table that are missing for a time range,
+    run it ahead of ingestion so every new row has a partition. Tables that are not partitioned are skipped.
+
+    Parameters:
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the partitioned table.
+    start (str or Timestamp): First point in time that has to be covered.
+    end (str or Timestamp): Last point in time that has to be covered, defaults to today.
+    months_ahead (int): Additional months created after the end.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    int: Number of created partitions.
+    """
+    engine = engine or get_engine()
+    end = pd.to_datetime("today") if end is None else local_time(end)
+
+    with engine.begin() as conn:
+        if not is_partitioned(conn, schema, table):
+            return 0
+        return create_missing_partitions(conn, schema, table, start, end + pd.DateOffset(months=months_ahead))
+
+
+def convert_to_partitioned(schema, table, column="timestamp", engine=None):
+    """
+    Converts a regular table into a table range partitioned by month, with the same columns and primary key.
+    The rows are copied into the new partitions and the old table is dropped in one transaction.
+
+    Parameters:
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the table.
+    column (str): Timestamp column the table is partitioned on, has to be part of the primary key.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    bool: True if the table was converted, False if it is already partitioned or does not exist.
+    """
+    engine = engine or get_engine()
+    inspector = inspect(engine)
+
+    if is_duckdb(engine) or not inspector.has_table(table, schema=schema):
+        return False
+
+    with engine.connect() as conn:
+        if is_partitioned(conn, schema, table):
+            return False
+        first, last = conn.execute(text(f'SELECT MIN("{column}"), MAX("{column}") FROM "{schema}"."{table}"')).one()
+
+    key_columns = inspector.get_pk_constraint(table, schema=schema)['constrained_columns'] or [column]
+    if column not in key_columns:
+        key_columns = [column] + key_columns
+    keys = ", ".join(f'"{col}"' for col in key_columns)
+
+    old_table = f"{table}_unpartitioned"
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE "{schema}"."{table}" RENAME TO "{old_table}";'))
+        conn.execute(text(f'ALTER TABLE "{schema}"."{old_table}" DROP CONSTRAINT IF EXISTS "{table}_pkey";'))
+        conn.execute(text(f"""
+            CREATE TABLE "{schema}"."{table}" (
+                LIKE "{schema}"."{old_table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                CONSTRAINT "{table}_pkey" PRIMARY KEY ({keys})
+            ) PARTITION BY RANGE ("{column}");
+        """))
+
+        if first is not None:
+            create_missing_partitions(conn, schema, table, first, last)
+
+        conn.execute(text(f'INSERT INTO "{schema}"."{table}" SELECT * FROM "{schema}"."{old_table}";'))
+        conn.execute(text(f'DROP TABLE "{schema}"."{old_table}";'))
+
+    return True
+
+
+def archive_partitions(schema, table, before, engine=None):
+    """
+    Detaches the monthly partitions that end before a point in time and moves them into the archive schema.
+    Archived months stay queryable as separate tables but are not scanned by queries on the table anymore.
+
+    Parameters:
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the partitioned table.
+    before (str or Timestamp): Partitions of months before this month are archived.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    list: Names of the archived partitions.
+    """
+    engine = engine or get_engine()
+    before = pd.to_datetime(before).strftime('%Y_%m')
+
+    archived = []
+    if is_duckdb(engine):
+        return archived
+
+    with engine.begin() as conn:
+        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}";'))
+        for name in get_partitions(conn, schema, table):
+            match = re.search(r"_p(\d{4}_\d{2})$", name)
+            if match is None or match.group(1) >= before:
+                continue
+            conn.execute(text(f'ALTER TABLE "{schema}"."{table}" DETACH PARTITION "{schema}"."{name}";'))
+            conn.execute(text(f'ALTER TABLE "{schema}"."{name}" SET SCHEMA "{archive_schema}";'))
+            archived.append(name)
+
+    return archived
+
+
+# Indexes of every table, (method, columns), applied after each load in addition to the primary key
+index_specs = {
+    ("01_bronze", "raw_open_meteo_weather_history"): [("btree", ["station_id", "timestamp"]), ("btree", ["loaded_at"])],
+    ("02_silver", "fact_full_weather"): [("btree", ["station_id", "timestamp"]), ("btree", ["updated_at"])],
+    ("02_silver", "fact_predicted_values"): [("btree", ["timestamp", "source"])],
+    ("03_gold", "fact_electricity_market_germany"): [("btree", ["timestamp"])],
+}
+
+# Columns that merges update in place with ON CONFLICT DO UPDATE, DuckDB can not update indexed columns so they are not indexed there
+merged_columns = {
+    ("01_bronze", "raw_open_meteo_weather_history"): ["loaded_at"],
+    ("02_silver", "fact_full_weather"): ["updated_at"],
+}
+
+
+def index_name(table, method, columns):
+    """
+    Returns the name of an index from index_specs.
+
+    Parameters:
+    table (str): Name of the table.
+    method (str): Index method, e.g. 'btree' or 'brin'.
+    columns (list): Indexed columns.
+
+    Returns:
+    str: Name like 'fact_full_weather_station_id_timestamp_btree_idx'.
+    """
+    return f"{table}_{'_'.join(columns)}_{method}_idx"
+
+
+def apply_indexes(schema, table, engine=None):
+    """
+    Creates the declared indexes of a table that are missing, e.g. after it was replaced, and updates its statistics.
+
+    Parameters:
+    schema (str): Schema of the table, e.g. '02_silver'.
+    table (str): Name of the table.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    list: Names of the declared indexes.
+    """
+    engine = engine or get_engine()
+    names = []
+
+    with engine.begin() as conn:
+        for method, columns in index_specs.get((schema, table), []):
+            name = index_name(table, method, columns)
+            # Indexes of files written before would make the next merge fail
+            if is_duckdb(engine) and set(columns) & set(merged_columns.get((schema, table), [])):
+                conn.execute(text(f'DROP INDEX IF EXISTS "{schema}"."{name}";'))
+                continue
+            keys = ", ".join(f'"{col}"' for col in columns)
+            using = "" if is_duckdb(engine) else f" USING {method}"
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{schema}"."{table}"{using} ({keys});'))
+            names.append(name)
+
+        conn.execute(text(f'ANALYZE "{schema}"."{table}";'))
+
+    return names
@@ -1,13 +1,18 @@
 import pandas as pd
 import streamlit as st
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from dotenv import load_dotenv
 import os
+import io
+from datetime import timedelta
+
+# Schemas of the medallion layers, created in a new DuckDB file
+medallion_schemas = ["01_bronze", "02_silver", "03_gold"]
    
     
 def get_data_from_db(sql_string):
     """
-    Connects to the PostgreSQL database and returns a DataFrame based on the given SQL query.
+    Connects to the database of get_engine, PostgreSQL or DuckDB, and returns a DataFrame based on the given SQL query.
 
     Parameters:
     sql_query (str): The SQL query to execute.
@@ -16,21 +21,9 @@ def get_data_from_db(sql_string):
     DataFrame: A pandas DataFrame containing the results of the query.
     """
     try:
-        # Load login data from .env file
-        load_dotenv()
-        
-        DB_NAME = os.getenv('DB_NAME')
-        DB_USERNAME = os.getenv('DB_USERNAME')
-        DB_PASSWORD = os.getenv('DB_PASSWORD')
-        DB_HOST = os.getenv('DB_HOST')
-        DB_PORT = os.getenv('DB_PORT')    
-        
-        # Create SQLAlchemy engine
-        DB_STRING = f'postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-        
-        # Create an SQLAlchemy engine
-        engine = create_engine(DB_STRING)    
-        
+        # Create an SQLAlchemy engine, DB_BACKEND in the .env file selects the database
+        engine = get_engine()
+
         # Use the engine to connect to the database and read the SQL query into a DataFrame
         with engine.connect() as conn:
             df = pd.read_sql_query(sql_string, conn)
@@ -42,9 +35,39 @@ def get_data_from_db(sql_string):
         return None   
     
     
+def get_weather_forecast_as_of(as_of, engine=None):
+    """
+    Returns the latest completed weather forecast snapshot that was fetched at or before a point in time.
+
+    Parameters:
+    as_of (str or Timestamp): Point in time, e.g. '2024-07-10 12:00+02:00'.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    DataFrame: Forecast rows of the snapshot, empty if nothing was fetched before as_of.
+    """
+    engine = engine or get_engine()
+    query = 'SELECT * FROM "01_bronze".weather_forecast_as_of(:as_of)'
+
+    # DuckDB has no SQL functions returning tables, the function body is inlined instead
+    if is_duckdb(engine):
+        query = """
+        SELECT * FROM "01_bronze".raw_open_meteo_weather_forecast_snapshots
+        WHERE timestamp_fetched = (
+            SELECT MAX(timestamp_fetched) FROM "01_bronze".raw_open_meteo_weather_forecast_snapshots_completed
+            WHERE timestamp_fetched <= :as_of
+        )
+        """
+    return pd.read_sql(text(query), engine, params={"as_of": to_utc(as_of)})
+
+
 def get_engine():   
     # Load login data from .env file
     load_dotenv()
+
+    # Local runs and benchmarks can use an embedded DuckDB file instead of PostgreSQL
+    if os.getenv('DB_BACKEND', 'postgres') == 'duckdb':
+        return get_duckdb_engine(os.getenv('DUCKDB_PATH', 'data/warehouse.duckdb'))
     
     DB_NAME = os.getenv('DB_NAME')
     DB_USERNAME = os.getenv('DB_USERNAME')
@@ -57,4 +80,436 @@ def get_engine():
     
     # Create an SQLAlchemy engine
     engine = create_engine(DB_STRING)
-    return engine
\ No newline at end of file
+    return engine
+
+
+def get_duckdb_engine(path):
+    """
+    Creates an SQLAlchemy engine for an embedded DuckDB file with the schemas of the medallion layers.
+
+    Parameters:
+    path (str): Path of the DuckDB file, created if it does not exist.
+
+    Returns:
+    Engine: SQLAlchemy engine using the duckdb_engine dialect.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    engine = create_engine(f"duckdb:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def create_schemas(dbapi_connection, connection_record):
+        # Same local time as the pipeline, e.g. for date_trunc on timestamps
+        dbapi_connection.execute("SET TimeZone = 'Europe/Berlin'")
+        for schema in medallion_schemas:
+            dbapi_connection.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+
+    return engine
+
+
+def is_duckdb(engine):
+    """
+    Checks if an engine connects to DuckDB instead of PostgreSQL.
+
+    Parameters:
+    engine (Engine): SQLAlchemy engine.
+
+    Returns:
+    bool: True for the DuckDB backend.
+    """
+    return engine.dialect.name == "duckdb"
+
+
+def to_utc(timestamp, timezone="Europe/Berlin"):
+    """
+    Converts a timestamp to a UTC datetime for binding it as a query parameter.
+    duckdb 1.0 binds datetimes with a pytz timezone wrong, UTC values are bound correctly on both backends.
+
+    Parameters:
+    timestamp (str, datetime or Timestamp): Point in time, e.g. '2024-07-10 12:00+02:00'.
+    timezone (str): Timezone of naive timestamps, e.g. 'Europe/Berlin'.
+
+    Returns:
+    datetime: Timezone-aware datetime in UTC.
+    """
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(timezone)
+    return timestamp.tz_convert("UTC").to_pydatetime()
+
+
+def bulk_upsert(df, schema, table, key_columns, engine=None):
+    """
+    Upserts a DataFrame into a table by streaming it with COPY into a temporary staging table.
+
+    Parameters:
+    df (DataFrame): The data to load, column names must match the target table.
+    schema (str): Schema of the target table, e.g. '01_bronze'.
+    table (str): Name of the target table.
+    key_columns (list): Columns of the unique constraint used for ON CONFLICT.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    int: Number of inserted or updated rows.
+    """
+    engine = engine or get_engine()
+    staging_table = f"{table}_staging"
+
+    columns = ", ".join(f'"{col}"' for col in df.columns)
+    keys = ", ".join(f'"{col}"' for col in key_columns)
+    updates = ", ".join(f'"{col}" = EXCLUDED."{col}"' for col in df.columns if col not in key_columns)
+    on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+
+    # Staging table gets the same column types as to_sql would create, it is dropped on commit
+    create_staging = pd.io.sql.get_schema(df, staging_table, con=engine).replace("CREATE TABLE", "CREATE TEMPORARY TABLE", 1)
+    create_staging = f"{create_staging.strip()} ON COMMIT DROP;"
+
+    upsert = f"""
+    INSERT INTO "{schema}"."{table}" ({columns})
+    SELECT {columns} FROM "{staging_table}"
+    ON CONFLICT ({keys}) {on_conflict};
+    """
+
+    # DuckDB reads the frame directly, no COPY needed
+    if is_duckdb(engine):
+        with engine.begin() as conn:
+            conn.connection.driver_connection.register(staging_table, df)
+            try:
+                # DuckDB returns the number of rows as result instead of a rowcount
+                return conn.execute(text(upsert)).scalar()
+            finally:
+                conn.connection.driver_connection.unregister(staging_table)
+
+    # Write frame to an in-memory csv for COPY
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(create_staging)
+        cursor.copy_expert(f'COPY "{staging_table}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(upsert)
+        row_count = cursor.rowcount
+        conn.commit()
+        cursor.close()
+        return row_count
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        conn.close()
+
+
+def create_table_query(df, schema, table, key_columns, engine):
+    """
+    Returns the DDL of a table for a DataFrame with its primary key declared inline, as DuckDB needs it.
+    Unlike get_schema with keys, integer keys stay plain integers instead of becoming serial columns.
+
+    Parameters:
+    df (DataFrame): The data that will be loaded into the table.
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the table.
+    key_columns (list): Columns of the primary key, None for a table without key.
+    engine (Engine): SQLAlchemy engine the DDL is written for.
+
+    Returns:
+    str: Query string.
+    """
+    query = pd.io.sql.get_schema(df.head(0), table, con=engine, schema=schema).rstrip()
+    if not key_columns:
+        return query
+
+    keys = ", ".join(f'"{col}"' for col in key_columns)
+    return f"{query[:-1].rstrip()},\n\tPRIMARY KEY ({keys})\n)"
+
+
+def swap_load(df, schema, table, key_columns=None, engine=None):
+    """
+    Replaces a table without readers ever seeing it missing or half written.
+    The DataFrame is copied into a shadow table that gets its primary key and declared indexes,
+    then the old table is dropped and the shadow table renamed in a single transaction.
+
+    Parameters:
+    df (DataFrame): The data that replaces the table.
+    schema (str): Schema of the table, e.g. '03_gold'.
+    table (str): Name of the table.
+    key_columns (list): Optional columns of the primary key.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    int: Number of loaded rows.
+    """
+    # db_schema imports db_utils, so the index specs are imported when they are needed
+    from packages.db_schema import index_specs, index_name, apply_indexes
+
+    engine = engine or get_engine()
+    shadow_table = f"{table}__shadow"
+    columns = ", ".join(f'"{col}"' for col in df.columns)
+    indexes = index_specs.get((schema, table), [])
+
+    create_shadow = pd.io.sql.get_schema(df, shadow_table, con=engine, schema=schema)
+
+    # DuckDB can not rename keys and indexes, the shadow table is created with its key and indexed after the swap
+    if is_duckdb(engine):
+        create_shadow = create_table_query(df, schema, shadow_table, key_columns, engine)
+        with engine.begin() as conn:
+            conn.connection.driver_connection.register("swap_load_frame", df)
+            conn.execute(text(f'DROP TABLE IF EXISTS "{schema}"."{shadow_table}";'))
+            conn.execute(text(create_shadow))
+            conn.execute(text(f'INSERT INTO "{schema}"."{shadow_table}" ({columns}) SELECT {columns} FROM swap_load_frame;'))
+            conn.connection.driver_connection.unregister("swap_load_frame")
+            conn.execute(text(f'DROP TABLE IF EXISTS "{schema}"."{table}";'))
+            conn.execute(text(f'ALTER TABLE "{schema}"."{shadow_table}" RENAME TO "{table}";'))
+        apply_indexes(schema, table, engine)
+        return len(df)
+
+    # Write frame to an in-memory csv for COPY
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+
+        # Build the shadow table completely before touching the live table
+        cursor.execute(f'DROP TABLE IF EXISTS "{schema}"."{shadow_table}";')
+        cursor.execute(create_shadow)
+        cursor.copy_expert(f'COPY "{schema}"."{shadow_table}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        if key_columns:
+            keys = ", ".join(f'"{col}"' for col in key_columns)
+            cursor.execute(f'ALTER TABLE "{schema}"."{shadow_table}" ADD CONSTRAINT "{shadow_table}_pkey" PRIMARY KEY ({keys});')
+        for method, index_columns in indexes:
+            index_keys = ", ".join(f'"{col}"' for col in index_columns)
+            cursor.execute(f'CREATE INDEX "{index_name(shadow_table, method, index_columns)}" ON "{schema}"."{shadow_table}" USING {method} ({index_keys});')
+        cursor.execute(f'ANALYZE "{schema}"."{shadow_table}";')
+        conn.commit()
+
+        # Swap in one short transaction, indexes and key get the names of the live table
+        cursor.execute(f'DROP TABLE IF EXISTS "{schema}"."{table}";')
+        cursor.execute(f'ALTER TABLE "{schema}"."{shadow_table}" RENAME TO "{table}";')
+        if key_columns:
+            cursor.execute(f'ALTER TABLE "{schema}"."{table}" RENAME CONSTRAINT "{shadow_table}_pkey" TO "{table}_pkey";')
+        for method, index_columns in indexes:
+            cursor.execute(f'ALTER INDEX "{schema}"."{index_name(shadow_table, method, index_columns)}" RENAME TO "{index_name(table, method, index_columns)}";')
+        conn.commit()
+
+        cursor.close()
+        return len(df)
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        conn.close()
+
+
+def ensure_table(df, schema, table, key_columns, engine=None):
+    """
+    Creates a table for a DataFrame with a primary key if it does not exist yet,
+    otherwise adds columns of the DataFrame that are missing in the table
+    and the primary key if the table was created without one.
+
+    Parameters:
+    df (DataFrame): The data that will be loaded into the table.
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the table.
+    key_columns (list): Columns of the primary key.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+    """
+    engine = engine or get_engine()
+    inspector = inspect(engine)
+
+    if not inspector.has_table(table, schema=schema) and is_duckdb(engine):
+        # DuckDB can not add a primary key to an existing table
+        with engine.begin() as conn:
+            conn.execute(text(create_table_query(df, schema, table, key_columns, engine)))
+        return
+
+    if not inspector.has_table(table, schema=schema):
+        df.head(0).to_sql(table, engine, schema=schema, index=False)
+        keys = ", ".join(f'"{col}"' for col in key_columns)
+        with engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE "{schema}"."{table}" ADD PRIMARY KEY ({keys});'))
+        return
+
+    with engine.connect() as conn:
+        existing_columns = set(conn.execute(
+            text("SELECT column_name FROM information_schema.columns WHERE table_schema = :schema AND table_name = :table"),
+            {"schema": schema, "table": table}
+        ).scalars())
+    missing_columns = [col for col in df.columns if col not in existing_columns]
+    # DuckDB tables are always created with their primary key
+    has_primary_key = is_duckdb(engine) or len(inspector.get_pk_constraint(table, schema=schema)['constrained_columns']) > 0
+
+    with engine.begin() as conn:
+        if not has_primary_key:
+            keys = ", ".join(f'"{col}"' for col in key_columns)
+            conn.execute(text(f'ALTER TABLE "{schema}"."{table}" ADD PRIMARY KEY ({keys});'))
+        for col in missing_columns:
+            if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+                col_type = "TIMESTAMP WITH TIME ZONE"
+            elif pd.api.types.is_numeric_dtype(df[col]):
+                col_type = "DOUBLE PRECISION"
+            else:
+                col_type = "TEXT"
+            conn.execute(text(f'ALTER TABLE "{schema}"."{table}" ADD COLUMN "{col}" {col_type};'))
+
+
+def get_watermark(schema, table, column="timestamp", group_by=None, engine=None):
+    """
+    Returns the high-water mark of a table, i.e. the latest value of a column.
+
+    Parameters:
+    schema (str): Schema of the table, e.g. '01_bronze'.
+    table (str): Name of the table.
+    column (str): Column to take the maximum of.
+    group_by (str): Optional column to get one watermark per value, e.g. 'station_id'.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    Timestamp or Series: The watermark, None for an empty table, or a Series indexed by group_by.
+    """
+    engine = engine or get_engine()
+
+    if group_by is None:
+        query = f'SELECT MAX("{column}") AS watermark FROM "{schema}"."{table}"'
+        watermark = pd.read_sql(query, engine)['watermark'].iloc[0]
+        return None if pd.isna(watermark) else watermark
+
+    query = f'SELECT "{group_by}", MAX("{column}") AS watermark FROM "{schema}"."{table}" GROUP BY "{group_by}"'
+    return pd.read_sql(query, engine).set_index(group_by)['watermark']
+
+
+def get_start_date(watermark, revision_days=1, default_days=7, timezone="Europe/Berlin"):
+    """
+    Returns the first day to fetch for an incremental load based on the watermark of the target table.
+
+    Parameters:
+    watermark (Timestamp): Latest timestamp already loaded, None if nothing is loaded yet.
+    revision_days (int): Days before the watermark that are fetched again to pick up revised values.
+    default_days (int): Lookback from today if there is no watermark.
+    timezone (str): Timezone the API expects dates in.
+
+    Returns:
+    str: Start date formatted as YYYY-MM-DD.
+    """
+    if watermark is None or pd.isna(watermark):
+        start = pd.to_datetime("today") - timedelta(days=default_days)
+    else:
+        start = pd.Timestamp(watermark).tz_convert(timezone) - timedelta(days=revision_days)
+
+    return start.strftime("%Y-%m-%d")
+
+
+def get_checkpoints(source, engine=None):
+    """
+    Returns the backfill checkpoints of a source, creating the checkpoint table if needed.
+
+    Parameters:
+    source (str): Name of the backfilled table, e.g. 'raw_open_meteo_weather_history_new'.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    DataFrame: One row per station with station_id, completed_until and status.
+    """
+    engine = engine or get_engine()
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS "01_bronze".backfill_checkpoints (
+                source TEXT NOT NULL,
+                station_id BIGINT NOT NULL,
+                completed_until DATE,
+                status TEXT NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (source, station_id)
+            );
+        """))
+        query = 'SELECT station_id, completed_until, status FROM "01_bronze".backfill_checkpoints WHERE source = :source'
+        return pd.read_sql(text(query), conn, params={"source": source})
+
+
+def save_checkpoint(source, station_id, completed_until, status, engine=None):
+    """
+    Persists how far the backfill of a station got, so an interrupted backfill can resume there.
+
+    Parameters:
+    source (str): Name of the backfilled table.
+    station_id (int): Id of the weather station.
+    completed_until (str): Last day that is loaded completely, None if nothing is loaded yet.
+    status (str): 'running' while the station is backfilled, 'done' afterwards.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+    """
+    engine = engine or get_engine()
+
+    query = """
+    INSERT INTO "01_bronze".backfill_checkpoints (source, station_id, completed_until, status, updated_at)
+    VALUES (:source, :station_id, :completed_until, :status, now())
+    ON CONFLICT (source, station_id)
+    DO UPDATE SET
+        completed_until = EXCLUDED.completed_until,
+        status = EXCLUDED.status,
+        updated_at = EXCLUDED.updated_at;
+    """
+    with engine.begin() as conn:
+        conn.execute(text(query), {
+            "source": source,
+            "station_id": int(station_id),
+            "completed_until": completed_until,
+            "status": status
+        })
+
+
+def get_stored_watermark(name, engine=None):
+    """
+    Returns the watermark an ETL job stored after its last run, creating the watermark table if needed.
+
+    Parameters:
+    name (str): Name of the job or table, e.g. 'fact_full_weather'.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+
+    Returns:
+    Timestamp: The stored watermark, None if the job has not run yet.
+    """
+    engine = engine or get_engine()
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS "02_silver".etl_watermarks (
+                name TEXT PRIMARY KEY,
+                watermark TIMESTAMPTZ,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """))
+        watermark = conn.execute(text('SELECT watermark FROM "02_silver".etl_watermarks WHERE name = :name'), {"name": name}).scalar()
+
+    return None if watermark is None else pd.Timestamp(watermark)
+
+
+def set_stored_watermark(name, watermark, engine=None):
+    """
+    Stores the watermark up to which an ETL job has processed its source.
+
+    Parameters:
+    name (str): Name of the job or table, e.g. 'fact_full_weather'.
+    watermark (Timestamp): Latest source timestamp that is processed.
+    engine (Engine): Optional SQLAlchemy engine, defaults to get_engine().
+    """
+    engine = engine or get_engine()
+
+    query = """
+    INSERT INTO "02_silver".etl_watermarks (name, watermark, updated_at)
+    VALUES (:name, :watermark, now())
+    ON CONFLICT (name)
+    DO UPDATE SET
+        watermark = EXCLUDED.watermark,
+        updated_at = EXCLUDED.updated_at;
+    """
+    with engine.begin() as conn:
+        conn.execute(text(query), {"name": name, "watermark": to_utc(watermark)})
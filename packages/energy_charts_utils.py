@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from packages.api_utils import api_url, parse_json
+
+ENERGY_CHARTS_URL = api_url("https://api.energy-charts.info")
+
+timezone = "Europe/Berlin"
+
+
+def fetch_prices(session, start, end, bzn="DE-LU"):
+    """
+    Fetches day-ahead prices of a bidding zone from the energy-charts API.
+
+    Parameters:
+    session (Session): Requests session used for the call, e.g. from get_retry_session.
+    start (str): First day, formatted as YYYY-MM-DD.
+    end (str): Last day, formatted as YYYY-MM-DD.
+    bzn (str): Bidding zone.
+
+    Returns:
+    DataFrame: Prices with columns timestamp, <bzn> and unit.
+    """
+    response = session.get(f"{ENERGY_CHARTS_URL}/price", params={"bzn": bzn, "start": start, "end": end})
+    response.raise_for_status()
+    json_data = parse_json(response)
+
+    # Combine into a DataFrame, unix seconds are UTC and converted to local time
+    df_prices = pd.DataFrame({
+        'timestamp': pd.to_datetime(np.asarray(json_data['unix_seconds'], dtype='int64'), unit='s', utc=True).tz_convert(timezone),
+        bzn: np.asarray(json_data['price'], dtype='float64'),
+        'unit': json_data['unit']
+    })
+
+    return df_prices
+
+
+def fetch_total_power(session, start, end, country="de"):
+    """
+    Fetches the public net electricity production per production type from the energy-charts API.
+
+    Parameters:
+    session (Session): Requests session used for the call, e.g. from get_retry_session.
+    start (str): First day, formatted as YYYY-MM-DD.
+    end (str): Last day, formatted as YYYY-MM-DD.
+    country (str): Country code.
+
+    Returns:
+    DataFrame: Production with a timestamp column and one column per production type.
+    """
+    response = session.get(f"{ENERGY_CHARTS_URL}/total_power", params={"country": country, "start": start, "end": end})
+    response.raise_for_status()
+    json_data = parse_json(response)
+
+    # Create a dictionary to hold the data for the DataFrame, unix seconds are UTC and converted to local time
+    data_dict = {'timestamp': pd.to_datetime(np.asarray(json_data['unix_seconds'], dtype='int64'), unit='s', utc=True).tz_convert(timezone)}
+
+    # Extract production type data and add to the dictionary
+    for production_type in json_data['production_types']:
+        data_dict[production_type['name']] = np.asarray(production_type['data'], dtype='float64')
+
+    # Convert the dictionary to a DataFrame
+    df_power = pd.DataFrame(data_dict)
+
+    return df_power
@@ -0,0 +1,198 @@
+import os
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from packages.api_utils import api_url, parse_json
+
+# The official client reads the binary FlatBuffers format, JSON is the fallback if it is not installed
+try:
+    import openmeteo_requests
+except ImportError:
+    openmeteo_requests = None
+
+HISTORY_URL = api_url("https://archive-api.open-meteo.com/v1/archive")
+FORECAST_URL = api_url("https://api.open-meteo.com/v1/dwd-icon")
+
+timezone = "Europe/Berlin"
+weather_variables = [
+            "temperature_2m",
+            "relative_humidity_2m",
+            "apparent_temperature",
+            "precipitation",
+            "cloud_cover",
+            "wind_speed_10m",
+            "wind_direction_10m",
+            "direct_radiation",
+            "diffuse_radiation",
+            "sunshine_duration"
+        ]
+
+
+def request_weight(n_days, n_variables=len(weather_variables), n_locations=1):
+    """
+    Returns how many API calls a request counts as in the Open-Meteo quota.
+    Requests with more than 10 variables or more than 2 weeks of data count as several calls.
+
+    Parameters:
+    n_days (int): Number of days requested.
+    n_variables (int): Number of hourly variables requested.
+    n_locations (int): Number of locations in the request.
+
+    Returns:
+    float: Weight of the request in API calls.
+    """
+    return max(1, n_variables / 10) * max(1, n_days / 14) * n_locations
+
+
+def empty_history_frame():
+    """
+    Returns an empty DataFrame with the columns and types of the weather history table,
+    e.g. to create the table or add missing columns with ensure_table before the first load.
+
+    Returns:
+    DataFrame: Empty frame with timestamp, station_id, the weather variables and loaded_at.
+    """
+    return pd.DataFrame({
+        "timestamp": pd.Series(dtype=f"datetime64[ns, {timezone}]"),
+        "station_id": pd.Series(dtype="int64"),
+        **{variable: pd.Series(dtype="float64") for variable in weather_variables},
+        "loaded_at": pd.Series(dtype=f"datetime64[ns, {timezone}]"),
+    })
+
+
+def batch_stations(station_id, latitude, longitude, batch_size=25):
+    """
+    Splits the station lists into batches that are requested together in one API call.
+
+    Parameters:
+    station_id (list): Ids of the weather stations.
+    latitude (list): Latitudes of the weather stations.
+    longitude (list): Longitudes of the weather stations.
+    batch_size (int): Maximum number of stations per request.
+
+    Returns:
+    list: List of (station_ids, latitudes, longitudes) tuples, one per batch.
+    """
+    return [
+        (station_id[i:i + batch_size], latitude[i:i + batch_size], longitude[i:i + batch_size])
+        for i in range(0, len(station_id), batch_size)
+    ]
+
+
+def use_flatbuffers():
+    """
+    Checks whether Open-Meteo data is requested in the FlatBuffers format. JSON is used by default,
+    set OPEN_METEO_TRANSPORT=flatbuffers in the .env file and install openmeteo-requests to opt in.
+
+    Returns:
+    bool: True for FlatBuffers, False for JSON.
+    """
+    load_dotenv()
+    transport = os.getenv('OPEN_METEO_TRANSPORT', 'json').lower()
+    return transport == 'flatbuffers' and openmeteo_requests is not None
+
+
+def combine_locations(times, values, station_ids):
+    """
+    Builds one DataFrame for several stations from per-location NumPy arrays.
+    Times are unix seconds in UTC and therefore keep both hours of the autumn DST change.
+
+    Parameters:
+    times (list): Array of unix seconds per location.
+    values (dict): List of value arrays per location, keyed by weather variable.
+    station_ids (list): Ids of the stations in the same order as the locations.
+
+    Returns:
+    DataFrame: Hourly weather data of all stations with a station_id column.
+    """
+    lengths = [len(time) for time in times]
+
+    data = {
+        'timestamp': pd.to_datetime(np.concatenate(times), unit='s', utc=True).tz_convert(timezone),
+        'station_id': np.repeat(station_ids, lengths)
+    }
+    for variable in weather_variables:
+        data[variable] = np.concatenate(values[variable]).astype('float64', copy=False)
+
+    return pd.DataFrame(data)
+
+
+def decode_weather_locations(locations, station_ids):
+    """
+    Builds one DataFrame for several stations from the per-location results of a JSON response.
+    Times must be requested with timeformat=unixtime.
+
+    Parameters:
+    locations (list): Per-location results of the response.
+    station_ids (list): Ids of the stations in the same order as the locations.
+
+    Returns:
+    DataFrame: Hourly weather data of all stations with a station_id column.
+    """
+    times = [np.asarray(location['hourly']['time'], dtype='int64') for location in locations]
+    values = {
+        variable: [np.asarray(location['hourly'][variable], dtype='float64') for location in locations]
+        for variable in weather_variables
+    }
+    return combine_locations(times, values, station_ids)
+
+
+def decode_weather_responses(responses, station_ids):
+    """
+    Builds one DataFrame for several stations from the FlatBuffers responses of openmeteo_requests.
+    Variables are returned in the order they were requested in.
+
+    Parameters:
+    responses (list): WeatherApiResponse per location.
+    station_ids (list): Ids of the stations in the same order as the responses.
+
+    Returns:
+    DataFrame: Hourly weather data of all stations with a station_id column.
+    """
+    times = []
+    values = {variable: [] for variable in weather_variables}
+
+    for response in responses:
+        hourly = response.Hourly()
+        times.append(np.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval(), dtype='int64'))
+        for i, variable in enumerate(weather_variables):
+            # FlatBuffers carries float32, rounding to the precision of the API stores the same values as JSON
+            values[variable].append(np.round(hourly.Variables(i).ValuesAsNumpy().astype('float64'), 2))
+
+    return combine_locations(times, values, station_ids)
+
+
+def fetch_weather_batch(session, url, params, station_ids, latitudes, longitudes):
+    """
+    Fetches weather data for several stations with a single request to the Open-Meteo API.
+
+    Parameters:
+    session (Session): Requests session used for the call, e.g. from get_retry_session.
+    url (str): Open-Meteo endpoint, HISTORY_URL or FORECAST_URL.
+    params (dict): Request parameters without latitude and longitude.
+    station_ids (list): Ids of the stations in the batch.
+    latitudes (list): Latitudes of the stations in the batch.
+    longitudes (list): Longitudes of the stations in the batch.
+
+    Returns:
+    DataFrame: Hourly weather data of all stations in the batch with a station_id column.
+    """
+    params = dict(params)
+    params["latitude"] = ",".join(str(latitude) for latitude in latitudes)
+    params["longitude"] = ",".join(str(longitude) for longitude in longitudes)
+
+    if use_flatbuffers():
+        client = openmeteo_requests.Client(session=session)
+        responses = client.weather_api(url, params=params)
+        return decode_weather_responses(responses, station_ids)
+
+    params["timeformat"] = "unixtime"
+    response = session.get(url, params=params)
+    response.raise_for_status()
+    data = parse_json(response)
+
+    # A request for a single location returns an object instead of a list
+    if isinstance(data, dict):
+        data = [data]
+
+    return decode_weather_locations(data, station_ids)
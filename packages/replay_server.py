@@ -0,0 +1,152 @@
+"""
+Local stand-in for the Open-Meteo and energy-charts APIs to run and benchmark the ingestion without network.
+
+Requests are expected as http://localhost:<port>/<host>/<path>?<query>, which is what api_url
+returns when API_REPLAY_URL=http://localhost:<port> is set in the .env file.
+
+Record responses once with network access, then replay them offline:
+
+    python -m packages.replay_server --record
+    python -m packages.replay_server --latency 0.2 --error-rate 0.05 --rate-limit-rate 0.05
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import requests
+
+
+def capture_key(host, path, query):
+    """
+    Returns the file name of a captured response, independent of the order of the query parameters.
+
+    Parameters:
+    host (str): Host of the live API, e.g. 'archive-api.open-meteo.com'.
+    path (str): Path of the endpoint, e.g. '/v1/archive'.
+    query (str): Query string of the request.
+
+    Returns:
+    str: Hash identifying the request.
+    """
+    params = sorted(parse_qsl(query, keep_blank_values=True))
+    return hashlib.sha256(f"{host}{path}?{urlencode(params)}".encode()).hexdigest()
+
+
+def request_random(seed, key, attempts, lock):
+    """
+    Returns a random generator for one request that only depends on the request and how often it was sent before,
+    so error patterns are reproducible no matter in which order the threads of the server handle the requests.
+
+    Parameters:
+    seed (int): Seed of the server, None for different patterns on every start.
+    key (str): Key of the request, see capture_key.
+    attempts (dict): Number of times every request was received, updated in place.
+    lock (Lock): Lock protecting attempts.
+
+    Returns:
+    Random: Generator for the draws of this request.
+    """
+    with lock:
+        attempt = attempts.get(key, 0)
+        attempts[key] = attempt + 1
+
+    if seed is None:
+        return random.Random()
+    return random.Random(hashlib.sha256(f"{seed}|{key}|{attempt}".encode()).hexdigest())
+
+
+def make_handler(capture_dir, record, latency, jitter, error_rate, rate_limit_rate, seed=None):
+    """
+    Creates the request handler of the replay server.
+
+    Parameters:
+    capture_dir (str): Directory with the captured responses.
+    record (bool): Fetch and store responses from the live API if they are not captured yet.
+    latency (float): Seconds every response is delayed.
+    jitter (float): Maximum random seconds added to the latency.
+    error_rate (float): Share of requests answered with a server error.
+    rate_limit_rate (float): Share of requests answered with 429 Too Many Requests.
+    seed (int): Seed for reproducible latency and errors, None for random ones.
+
+    Returns:
+    class: Request handler for ThreadingHTTPServer.
+    """
+    attempts = {}
+    lock = threading.Lock()
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            host, _, path = parts.path.lstrip('/').partition('/')
+            path = f"/{path}" if path else ""
+            key = capture_key(host, path, parts.query)
+            body_file = os.path.join(capture_dir, f"{key}.body")
+            meta_file = os.path.join(capture_dir, f"{key}.json")
+
+            draws = request_random(seed, key, attempts, lock)
+            time.sleep(latency + draws.uniform(0, jitter))
+
+            # Simulate an unreliable upstream, the session of get_retry_session retries all of these responses
+            draw = draws.random()
+            if draw < rate_limit_rate:
+                return self.send_body(429, b'{"error": true, "reason": "Too many requests"}', "application/json", {"Retry-After": "1"})
+            if draw < rate_limit_rate + error_rate:
+                return self.send_body(draws.choice([500, 502, 503, 504]), b'{"error": true}', "application/json")
+
+            if not os.path.exists(body_file):
+                if not record:
+                    return self.send_body(404, b'{"error": true, "reason": "Response not captured"}', "application/json")
+
+                upstream = f"https://{host}{path}" + (f"?{parts.query}" if parts.query else "")
+                response = requests.get(upstream, timeout=300)
+                if response.status_code != 200:
+                    return self.send_body(response.status_code, response.content, response.headers.get("Content-Type", ""))
+
+                with open(body_file, 'wb') as file:
+                    file.write(response.content)
+                with open(meta_file, 'w') as file:
+                    json.dump({"url": upstream, "content_type": response.headers.get("Content-Type", "")}, file)
+
+            with open(body_file, 'rb') as file:
+                body = file.read()
+            with open(meta_file) as file:
+                meta = json.load(file)
+
+            self.send_body(200, body, meta["content_type"])
+
+        def send_body(self, status, body, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return ReplayHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured Open-Meteo and energy-charts responses.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--capture-dir", default="data/replay")
+    parser.add_argument("--record", action="store_true", help="fetch responses that are not captured from the live API")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every response is delayed")
+    parser.add_argument("--jitter", type=float, default=0.0, help="maximum random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 5xx")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible error patterns")
+    args = parser.parse_args()
+
+    os.makedirs(args.capture_dir, exist_ok=True)
+
+    handler = make_handler(args.capture_dir, args.record, args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.seed)
+    server = ThreadingHTTPServer(("localhost", args.port), handler)
+    print(f"Replay server listening on http://localhost:{args.port} ...")
+    server.serve_forever()
@@ -0,0 +1,167 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import pandas as pd
+from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# Days after which data of a source is not revised anymore, younger windows are only cached for a short time
+revision_horizons = {
+    "archive-api.open-meteo.com": 7,
+    "api.energy-charts.info/price": 2,
+    "api.energy-charts.info/total_power": 7,
+}
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for API responses in a SQLite file, with a size cap and least recently used eviction.
+
+    Parameters:
+    path (str): Path of the SQLite file.
+    max_size (int): Maximum total size of the cached bodies in bytes.
+    """
+
+    def __init__(self, path=".response_cache.sqlite", max_size=2 * 1024 ** 3):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # Ingestion scripts run as parallel processes on the same file, WAL lets them read while one writes
+        # and the timeout makes writers wait for each other instead of failing with "database is locked"
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                content_type TEXT,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, key):
+        """
+        Returns a cached response if it exists and is not expired.
+
+        Parameters:
+        key (str): Key of the response, see cache_key.
+
+        Returns:
+        tuple: (body, content_type) or None.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, content_type FROM responses WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+        return row
+
+    def set(self, key, body, content_type, ttl=None):
+        """
+        Stores a response and evicts expired and least recently used responses above the size cap.
+
+        Parameters:
+        key (str): Key of the response, see cache_key.
+        body (bytes): Body of the response.
+        content_type (str): Content-Type header of the response.
+        ttl (float): Seconds the response is valid, None to keep it until it is evicted.
+        """
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, content_type, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, body, content_type, len(body), expires_at, now)
+            )
+            self.conn.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            self.conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_access DESC, key) AS cumulated_size FROM responses
+                    ) WHERE cumulated_size > ?
+                )
+            """, (self.max_size,))
+            self.conn.commit()
+
+
+def cache_key(url):
+    """
+    Returns source, location, date window and content hash of an API request.
+
+    Parameters:
+    url (str): Full url of the request including the query.
+
+    Returns:
+    tuple: (source, window_end, key), window_end is None for requests without a date window.
+    """
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    source = f"{parts.netloc}{parts.path}".rstrip("/")
+
+    single = dict(params)
+    location = ",".join(single[name] for name in ["latitude", "longitude", "country", "bzn"] if name in single)
+    window_start = single.get("start_date", single.get("start", ""))
+    window_end = single.get("end_date", single.get("end"))
+
+    # Remaining parameters like variables or format are part of the content as well, variables can be repeated
+    window_params = ["latitude", "longitude", "country", "bzn", "start_date", "start", "end_date", "end"]
+    other = sorted((name, value) for name, value in params if name not in window_params)
+    identity = f"{source}|{location}|{window_start}|{window_end}|{urlencode(other)}"
+    return source, window_end, hashlib.sha256(identity.encode()).hexdigest()
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter that answers requests for finished date windows from a ResponseCache.
+    Windows older than the revision horizon of their source are kept indefinitely,
+    recent or open windows only for `recent_ttl` seconds.
+
+    Parameters:
+    cache (ResponseCache): Cache the responses are stored in.
+    recent_ttl (float): Seconds responses of recent windows are valid.
+    """
+
+    def __init__(self, cache, recent_ttl=3600, **kwargs):
+        self.cache = cache
+        self.recent_ttl = recent_ttl
+        super().__init__(**kwargs)
+
+    def ttl(self, source, window_end):
+        horizon = next((days for name, days in revision_horizons.items() if name in source), None)
+        if horizon is None or window_end is None:
+            return self.recent_ttl
+
+        if pd.to_datetime(window_end) < pd.to_datetime("today").normalize() - pd.Timedelta(days=horizon):
+            return None
+        return self.recent_ttl
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        source, window_end, key = cache_key(request.url)
+        cached = self.cache.get(key)
+
+        if cached is not None:
+            response = Response()
+            response.status_code = 200
+            response.reason = "OK"
+            response._content = cached[0]
+            response.headers["Content-Type"] = cached[1] or ""
+            response.url = request.url
+            response.request = request
+            response.from_cache = True
+            return response
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            self.cache.set(key, response.content, response.headers.get("Content-Type"), self.ttl(source, window_end))
+        return response
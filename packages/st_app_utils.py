@@ -2,6 +2,7 @@ import pandas as pd
 from datetime import datetime, timedelta
 from sqlalchemy import create_engine
 import streamlit as st
+from packages.db_utils import get_duckdb_engine
 
 def get_timeframe(ts):
     today = pd.to_datetime(datetime.now().date())
@@ -19,6 +20,10 @@ def get_timeframe(ts):
         return 'other'
     
 def st_get_engine():
+    # Embedded DuckDB file instead of PostgreSQL, e.g. [duckdb] path = "data/warehouse.duckdb"
+    if "duckdb" in st.secrets:
+        return get_duckdb_engine(st.secrets["duckdb"]["path"])
+
     # Read secrets
     host = st.secrets["postgres"]["host"]
     port = st.secrets["postgres"]["port"]
@@ -101,8 +101,8 @@ konzessionsabgaben_2024 = {
 def fetch_market_prices():
     query_prices = """SELECT timestamp, de_lu as price, unit
         FROM "02_silver".fact_day_ahead_prices_germany
-        WHERE date_trunc('day', "timestamp") >= (
-            SELECT MAX(date_trunc('day', "timestamp")) - INTERVAL '365 days'
+        WHERE "timestamp" >= (
+            SELECT date_trunc('day', MAX("timestamp")) - INTERVAL '365 days'
             FROM "02_silver".fact_day_ahead_prices_germany
         );
     """
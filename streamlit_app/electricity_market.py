@@ -16,8 +16,8 @@ def load_data(query):
     return df
 
 query_string1 = """select * from "03_gold".fact_electricity_market_germany
-    WHERE date_trunc('day', "timestamp") >= (
-    SELECT MAX(date_trunc('day', "timestamp")) - INTERVAL '7 days'
+    WHERE "timestamp" >= (
+    SELECT date_trunc('day', MAX("timestamp")) - INTERVAL '7 days'
     FROM "03_gold".fact_electricity_market_germany)"""
 
 df_power = load_data(query_string1)
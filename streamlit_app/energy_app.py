@@ -17,8 +17,8 @@ def load_data(query):
 #Place for queries
 query_string1 = """ SELECT timestamp, date, time, de_lu as price, unit
 FROM "02_silver".fact_day_ahead_prices_germany
-WHERE date_trunc('day', "timestamp") >= (
-    SELECT MAX(date_trunc('day', "timestamp")) - INTERVAL '7 days'
+WHERE "timestamp" >= (
+    SELECT date_trunc('day', MAX("timestamp")) - INTERVAL '7 days'
     FROM "02_silver".fact_day_ahead_prices_germany
         );
 """
@@ -26,15 +26,13 @@ WHERE date_trunc('day', "timestamp") >= (
 query_string2 = """
 select 
     timestamp,
-    TO_CHAR(timestamp, 'HH24:MI') AS time,
-    TO_CHAR(timestamp, 'YYYY-MM-DD') AS date,
     avg(temperature_2m) as "temp",
     avg(sunshine_duration) as "sun",
     avg(wind_speed_10m) as wind
 from "02_silver".fact_full_weather ffw 
 left join "02_silver".dim_weather_stations dws on ffw.station_id = dws.station_id
-    WHERE date_trunc('day', "timestamp") >= (
-            SELECT MAX(date_trunc('day', "timestamp")) - INTERVAL '7 days'
+    WHERE "timestamp" >= (
+            SELECT date_trunc('day', MAX("timestamp")) - INTERVAL '7 days'
             FROM "02_silver".fact_day_ahead_prices_germany        
         )
         group by timestamp
@@ -44,6 +42,10 @@ left join "02_silver".dim_weather_stations dws on ffw.station_id = dws.station_i
 df_prices = load_data(query_string1)
 df_weather = load_data(query_string2)
 
+#time and date in local time, TO_CHAR is PostgreSQL only
+df_weather["time"] = df_weather["timestamp"].dt.strftime('%H:%M')
+df_weather["date"] = df_weather["timestamp"].dt.strftime('%Y-%m-%d')
+
 ################## data transformation ##################
 
 #get timefram entries
@@ -15,8 +15,8 @@ def load_data(query):
 #Place for queries
 query_string1 = """ SELECT timestamp, date, time, de_lu as price, unit
     FROM "02_silver".fact_day_ahead_prices_germany
-    WHERE date_trunc('day', "timestamp") >= (
-        SELECT MAX(date_trunc('day', "timestamp")) - INTERVAL '7 days'
+    WHERE "timestamp" >= (
+        SELECT date_trunc('day', MAX("timestamp")) - INTERVAL '7 days'
         FROM "02_silver".fact_day_ahead_prices_germany
     );
 """
@@ -18,8 +18,8 @@ def load_data(query):
     return df
 
 query_string2 = """select * from "03_gold".fact_electricity_market_germany
-    WHERE date_trunc('day', "timestamp") >= (
-    SELECT MAX(date_trunc('day', "timestamp")) - INTERVAL '30 days'
+    WHERE "timestamp" >= (
+    SELECT date_trunc('day', MAX("timestamp")) - INTERVAL '30 days'
     FROM "02_silver".fact_total_power_germany)"""
 
 df_weather = load_data(query_string2)
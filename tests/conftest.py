@@ -0,0 +1,18 @@
+import os
+import sys
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from packages.db_utils import get_duckdb_engine
+
+
+@pytest.fixture
+def duckdb_engine(tmp_path):
+    """
+    Returns an engine on an empty DuckDB file, the in-process backend of the tests.
+    """
+    engine = get_duckdb_engine(str(tmp_path / "warehouse.duckdb"))
+    yield engine
+    engine.dispose()
@@ -0,0 +1,26 @@
+import time
+from packages.api_utils import TokenBucket
+
+
+def test_token_bucket_allows_the_burst_without_waiting():
+    bucket = TokenBucket(rate=1, capacity=5)
+    started = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.1
+
+
+def test_token_bucket_waits_for_refilled_tokens():
+    bucket = TokenBucket(rate=20, capacity=2)
+    bucket.acquire(2)
+    started = time.monotonic()
+    bucket.acquire(2)
+    assert time.monotonic() - started >= 0.09
+
+
+def test_token_bucket_caps_requests_bigger_than_the_bucket():
+    bucket = TokenBucket(rate=1000, capacity=3)
+    started = time.monotonic()
+    bucket.acquire(10)
+    assert time.monotonic() - started < 0.1
+    assert bucket.tokens < 1
@@ -0,0 +1,32 @@
+import pandas as pd
+from packages.data_quality import check_gaps, check_duplicates
+
+
+def test_check_gaps_ignores_dst_changes():
+    # 2024-03-31 has 23 hours and 2024-10-27 has 25 hours in Europe/Berlin
+    spring = pd.DataFrame({"timestamp": pd.date_range("2024-03-30 22:00", "2024-03-31 05:00", freq="h", tz="Europe/Berlin")})
+    autumn = pd.DataFrame({"timestamp": pd.date_range("2024-10-26 22:00", "2024-10-27 05:00", freq="h", tz="Europe/Berlin")})
+    assert check_gaps(spring, "timestamp", "1h") == (0, None)
+    assert check_gaps(autumn, "timestamp", "1h") == (0, None)
+
+
+def test_check_gaps_counts_missing_hours_across_dst():
+    hours = pd.date_range("2024-03-30 22:00", "2024-03-31 05:00", freq="h", tz="Europe/Berlin")
+    df = pd.DataFrame({"timestamp": hours.delete([3, 4])})
+    missing, details = check_gaps(df, "timestamp", "1h")
+    assert missing == 2
+    assert details == f'["{hours[3]}"]'
+
+
+def test_check_gaps_per_series():
+    hours = pd.date_range("2024-01-01", periods=4, freq="h", tz="Europe/Berlin")
+    df = pd.concat([
+        pd.DataFrame({"timestamp": hours, "station_id": 1}),
+        pd.DataFrame({"timestamp": hours.delete(1), "station_id": 2}),
+    ])
+    assert check_gaps(df, "timestamp", "1h", "station_id") == (1, f'["2 {hours[1]}"]')
+
+
+def test_check_duplicates_counts_repeated_keys():
+    df = pd.DataFrame({"timestamp": ["2024-01-01 00:00", "2024-01-01 00:00", "2024-01-01 01:00"], "station_id": [1, 1, 1]})
+    assert check_duplicates(df, ["timestamp", "station_id"]) == (1, '["2024-01-01 00:00 1"]')
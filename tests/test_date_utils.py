@@ -0,0 +1,20 @@
+from packages.date_utils import monthly_windows
+
+
+def test_monthly_windows_end_on_the_first_day_of_the_next_month():
+    assert monthly_windows("2024-01-15", "2024-03-10") == [
+        ("2024-01-15", "2024-02-01"),
+        ("2024-02-01", "2024-03-01"),
+        ("2024-03-01", "2024-03-10"),
+    ]
+
+
+def test_monthly_windows_cover_the_range_without_overlap():
+    windows = monthly_windows("2023-11-03", "2024-02-29")
+    assert windows[0][0] == "2023-11-03"
+    assert windows[-1][1] == "2024-02-29"
+    assert all(previous[1] == following[0] for previous, following in zip(windows, windows[1:]))
+
+
+def test_monthly_windows_within_one_month():
+    assert monthly_windows("2024-02-05", "2024-02-20") == [("2024-02-05", "2024-02-20")]
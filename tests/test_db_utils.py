@@ -0,0 +1,49 @@
+import pandas as pd
+from sqlalchemy import text
+from packages.db_utils import bulk_upsert, ensure_table, to_utc
+
+
+def test_ensure_table_adds_columns_to_indexed_duckdb_table(duckdb_engine):
+    df = pd.DataFrame({"timestamp": pd.date_range("2024-01-01", periods=3, freq="h", tz="Europe/Berlin"), "value": [1.0, 2.0, 3.0]})
+    ensure_table(df, "01_bronze", "readings", ["timestamp"], duckdb_engine)
+    with duckdb_engine.begin() as conn:
+        conn.execute(text('CREATE INDEX readings_value_idx ON "01_bronze".readings (value);'))
+
+    ensure_table(df.assign(loaded_at=pd.Timestamp("2024-01-02", tz="Europe/Berlin")), "01_bronze", "readings", ["timestamp"], duckdb_engine)
+
+    with duckdb_engine.connect() as conn:
+        columns = conn.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name = 'readings'")).scalars().all()
+        indexes = conn.execute(text("SELECT index_name FROM duckdb_indexes() WHERE table_name = 'readings'")).scalars().all()
+    assert "loaded_at" in columns
+    assert indexes == ["readings_value_idx"]
+
+
+def test_to_utc_binds_the_same_point_in_time(duckdb_engine):
+    local = pd.Timestamp("2024-03-31 03:00", tz="Europe/Berlin")
+    with duckdb_engine.connect() as conn:
+        same = conn.execute(text("SELECT :point = TIMESTAMPTZ '2024-03-31 01:00:00+00:00'"), {"point": to_utc(local)}).scalar()
+    assert same
+    assert to_utc("2024-01-01") == pd.Timestamp("2023-12-31 23:00", tz="UTC")
+
+
+def test_bulk_upsert_inserts_new_and_updates_existing_keys(duckdb_engine):
+    hours = pd.date_range("2024-01-01", periods=3, freq="h", tz="Europe/Berlin")
+    df = pd.DataFrame({"timestamp": hours, "station_id": 1, "value": [1.0, 2.0, 3.0]})
+    ensure_table(df, "01_bronze", "readings", ["timestamp", "station_id"], duckdb_engine)
+    assert bulk_upsert(df, "01_bronze", "readings", ["timestamp", "station_id"], duckdb_engine) == 3
+
+    revised = pd.DataFrame({"timestamp": hours[2:].append(hours[:1] + pd.Timedelta(hours=3)), "station_id": 1, "value": [30.0, 4.0]})
+    assert bulk_upsert(revised, "01_bronze", "readings", ["timestamp", "station_id"], duckdb_engine) == 2
+
+    stored = pd.read_sql('SELECT value FROM "01_bronze".readings ORDER BY "timestamp"', duckdb_engine)
+    assert stored.value.tolist() == [1.0, 2.0, 30.0, 4.0]
+
+
+def test_bulk_upsert_with_key_columns_only_skips_existing_rows(duckdb_engine):
+    df = pd.DataFrame({"timestamp": pd.date_range("2024-01-01", periods=2, freq="h", tz="Europe/Berlin")})
+    ensure_table(df, "01_bronze", "hours", ["timestamp"], duckdb_engine)
+    bulk_upsert(df, "01_bronze", "hours", ["timestamp"], duckdb_engine)
+    bulk_upsert(df, "01_bronze", "hours", ["timestamp"], duckdb_engine)
+
+    with duckdb_engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*) FROM "01_bronze".hours')).scalar() == 2
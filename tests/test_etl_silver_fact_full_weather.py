@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import pandas as pd
+from sqlalchemy import text
+from conftest import root
+from packages.db_utils import ensure_table, bulk_upsert
+from packages.open_meteo_utils import weather_variables, empty_history_frame
+
+script = os.path.join(root, "database", "02_etl_scripts", "etl_silver_fact_full_weather.py")
+
+
+def seed(engine):
+    history = pd.MultiIndex.from_product(
+        [pd.date_range("2026-03-20", "2026-04-05", freq="h", tz="Europe/Berlin"), [1, 2]], names=["timestamp", "station_id"]
+    ).to_frame(index=False)
+    history[weather_variables] = 1.0
+    history["loaded_at"] = pd.Timestamp("2026-04-06", tz="Europe/Berlin")
+    ensure_table(empty_history_frame(), "01_bronze", "raw_open_meteo_weather_history", ["timestamp", "station_id"], engine)
+    bulk_upsert(history, "01_bronze", "raw_open_meteo_weather_history", ["timestamp", "station_id"], engine)
+
+    forecast = pd.MultiIndex.from_product(
+        [pd.date_range("2026-04-04", "2026-04-08", freq="h", tz="Europe/Berlin"), [1, 2]], names=["timestamp", "station_id"]
+    ).to_frame(index=False)
+    forecast[weather_variables] = 2.0
+    forecast["is_forecast"] = "yes"
+    forecast.to_sql("raw_open_meteo_weather_forecast", engine, schema="01_bronze", index=False)
+
+
+def run_script(path):
+    env = dict(os.environ, DB_BACKEND="duckdb", DUCKDB_PATH=path, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    return subprocess.run([sys.executable, script], cwd=root, env=env, capture_output=True, text=True)
+
+
+def test_merge_runs_twice_on_duckdb(duckdb_engine, tmp_path):
+    seed(duckdb_engine)
+    duckdb_engine.dispose()
+    path = str(tmp_path / "warehouse.duckdb")
+
+    for _ in range(2):
+        run = run_script(path)
+        assert run.returncode == 0, run.stdout + run.stderr
+    assert "0 rows inserted or updated." in run.stdout
+
+    # A revised hour and a lagging station that catches up on hours long before the latest one
+    with duckdb_engine.begin() as conn:
+        conn.execute(text('''
+            UPDATE "01_bronze".raw_open_meteo_weather_history SET temperature_2m = 5, loaded_at = now()
+            WHERE "timestamp" = (SELECT MAX("timestamp") FROM "01_bronze".raw_open_meteo_weather_history)
+        '''))
+        conn.execute(text('''
+            INSERT INTO "01_bronze".raw_open_meteo_weather_history
+            SELECT "timestamp", 3 AS station_id, COLUMNS(* EXCLUDE ("timestamp", station_id, loaded_at)), now() AS loaded_at
+            FROM "01_bronze".raw_open_meteo_weather_history WHERE station_id = 1 AND "timestamp" < '2026-03-21'
+        '''))
+    duckdb_engine.dispose()
+    run = run_script(path)
+    assert run.returncode == 0, run.stdout + run.stderr
+    assert "26 rows inserted or updated." in run.stdout
+
+    with duckdb_engine.connect() as conn:
+        total, updated, hist = conn.execute(text(
+            'SELECT COUNT(*), COUNT(*) FILTER (WHERE temperature_2m = 5), COUNT(*) FILTER (WHERE source_table = \'hist\') FROM "02_silver".fact_full_weather'
+        )).one()
+    assert (total, updated, hist) == (986, 2, 792)
@@ -0,0 +1,37 @@
+import pandas as pd
+from packages.response_cache import ResponseCache, CachingAdapter, cache_key
+
+archive = "https://archive-api.open-meteo.com/v1/archive"
+
+
+def test_cache_key_ignores_parameter_order():
+    first = cache_key(f"{archive}?latitude=52.5&longitude=13.4&start_date=2024-01-01&end_date=2024-01-31&hourly=temperature_2m&hourly=cloud_cover")
+    second = cache_key(f"{archive}?hourly=temperature_2m&hourly=cloud_cover&end_date=2024-01-31&start_date=2024-01-01&longitude=13.4&latitude=52.5")
+    assert first == second
+    assert first[:2] == ("archive-api.open-meteo.com/v1/archive", "2024-01-31")
+
+
+def test_cache_key_differs_by_location_and_window():
+    base = cache_key(f"{archive}?latitude=52.5&longitude=13.4&start_date=2024-01-01&end_date=2024-01-31")
+    assert cache_key(f"{archive}?latitude=48.1&longitude=11.6&start_date=2024-01-01&end_date=2024-01-31")[2] != base[2]
+    assert cache_key(f"{archive}?latitude=52.5&longitude=13.4&start_date=2024-01-01&end_date=2024-02-01")[2] != base[2]
+
+
+def test_ttl_keeps_windows_older_than_the_revision_horizon(tmp_path):
+    adapter = CachingAdapter(ResponseCache(str(tmp_path / "cache.sqlite")), recent_ttl=60)
+    source = "archive-api.open-meteo.com/v1/archive"
+    today = pd.to_datetime("today").normalize()
+
+    assert adapter.ttl(source, (today - pd.Timedelta(days=30)).strftime("%Y-%m-%d")) is None
+    assert adapter.ttl(source, (today - pd.Timedelta(days=3)).strftime("%Y-%m-%d")) == 60
+    assert adapter.ttl(source, None) == 60
+    assert adapter.ttl("api.open-meteo.com/v1/dwd-icon", "2020-01-01") == 60
+
+
+def test_expired_responses_are_not_returned(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.set("finished", b"{}", "application/json")
+    cache.set("recent", b"{}", "application/json", ttl=-1)
+
+    assert cache.get("finished") == (b"{}", "application/json")
+    assert cache.get("recent") is None